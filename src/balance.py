@@ -0,0 +1,266 @@
+'''Monte Carlo balance runs, many seeded fights per weapon / enemy matchup spread over all cores.
+
+    python balance.py --fights 20000                                  # every weapon against every enemy
+    python balance.py --weapons Sword Axe --enemies Orc --set Orc.armor=20 --json balance.json
+    python balance.py --mode level --policy greedy --runs 200 --width 60 --height 40 --level-enemies 10
+
+Duels are the player standing next to one enemy, turn order as in play_turn, thousands of them
+run at once through the vectorized combat resolver. Level runs play whole HeadlessGame maps.
+Work is cut into fixed size tasks, each with its own stream spawned from --seed, so results
+don't depend on how many workers there are.
+'''
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pygame
+from headless import HeadlessGame, MOVE_KEYS, placeholder_sprites
+from game import create_prototypes
+from entities.player import Player
+from items.weapon import Weapon
+from systems.gamefield import NEIGHBOURS
+from systems.combat import weapon_arrays, target_arrays, resolve_attacks, tick_effects
+from utils.functions import manhattan_distance
+
+MAX_TURNS = 500
+TASK_SIZE = 2000  # duels per task, level runs get TASK_SIZE // 200
+# Key that moves the player by each NEIGHBOURS step
+STEP_KEYS = dict(zip(NEIGHBOURS, MOVE_KEYS))
+SLOT_KEYS = dict(zip(range(1, 11), (pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5,
+                                    pygame.K_6, pygame.K_7, pygame.K_8, pygame.K_9, pygame.K_0)))
+
+_prototypes_cache = {}
+
+def parse_overrides(specs) -> tuple:
+    '''"Orc.armor=20" style specs to ((name, field, value), ...)'''
+    overrides = []
+    for spec in specs:
+        target, _, value = spec.partition('=')
+        name, _, field = target.rpartition('.')
+        if not (name and field and value):
+            raise ValueError(f'bad override {spec!r}, expected Name.field=value')
+        overrides.append((name, field, value))
+    return tuple(overrides)
+
+def prototypes(overrides=()) -> tuple[dict, dict, Player]:
+    '''Item and enemy prototypes with the overrides applied, built once per process'''
+    cached = _prototypes_cache.get(overrides)
+    if cached is not None:
+        return cached
+
+    sprites = placeholder_sprites()
+    items, enemies = create_prototypes(sprites, sprites['Floor'])
+    for name, field, value in overrides:
+        thing = items.get(name) or enemies.get(name)
+        if thing is None or field not in thing.proto._fields:
+            raise ValueError(f'nothing to override at {name}.{field}')
+        thing.proto = thing.proto._replace(**{field: type(getattr(thing.proto, field))(value)})
+        if name in enemies:
+            thing._init_state(thing.pos)
+    player = Player(sprites['Player'], sprites['Inventory_slot'], sprites['Selected_slot'])
+    _prototypes_cache[overrides] = items, enemies, player
+    return items, enemies, player
+
+def _take(stats: dict, idx) -> dict:
+    return {field: values[idx] for field, values in stats.items()}
+
+def _put(stats: dict, idx, results: dict) -> None:
+    for field, values in stats.items():
+        values[idx] = results[field]
+
+def duels(weapon: str, enemy: str, fights: int, seed, overrides=(), max_turns: int = MAX_TURNS) -> dict:
+    '''fights duels of the player holding weapon against enemy, per fight outcome arrays'''
+    items, enemies, player = prototypes(overrides)
+    rng = np.random.default_rng(seed)
+    foe = enemies[enemy]
+    player_weapon = weapon_arrays([items[weapon]] * fights)
+    foe_weapon = weapon_arrays([foe.weapon] * fights)
+    you = target_arrays([player] * fights)
+    them = target_arrays([foe] * fights)
+
+    active = np.ones(fights, dtype=bool)
+    won = np.zeros(fights, dtype=bool)
+    turns = np.full(fights, max_turns, dtype=np.int32)
+    idx = np.arange(fights)
+    for turn in range(1, max_turns + 1):
+        # Player hits, then bleeds, then the enemy gets its turn if it's still standing
+        _put(them, idx, resolve_attacks(_take(player_weapon, idx), _take(them, idx), you['stunned'][idx], rng))
+        _put(you, idx, tick_effects(_take(you, idx)))
+        killed = idx[them['health'][idx] <= 0]
+        won[killed] = True
+        turns[killed] = turn
+        active[killed] = False
+        idx = np.flatnonzero(active)
+
+        _put(you, idx, resolve_attacks(_take(foe_weapon, idx), _take(you, idx), them['stunned'][idx], rng))
+        _put(them, idx, tick_effects(_take(them, idx)))
+        died = idx[you['health'][idx] <= 0]
+        turns[died] = turn
+        active[died] = False
+        idx = np.flatnonzero(active)
+        if not len(idx):
+            break
+
+    return {
+        'won': won,
+        'timeout': active,
+        'turns': turns,
+        'hp_lost': player.health - np.maximum(0, you['health']),
+    }
+
+def _step_key(game: HeadlessGame, goal):
+    '''Key for the first step towards goal, None if it can't be reached'''
+    pos = game.player.pos
+    if manhattan_distance(pos, goal) == 1:
+        return STEP_KEYS[(goal[0] - pos[0], goal[1] - pos[1])]
+    path = game.game_field.astar_path(tuple(pos), tuple(goal), max_expansions=2000)
+    if path:
+        return STEP_KEYS[(path[0][0] - pos[0], path[0][1] - pos[1])]
+    return None
+
+def greedy_key(game: HeadlessGame) -> int:
+    '''Arms itself with the nearest weapon first, then walks to the nearest enemy and hits it.
+    Random key when there is nothing it can reach'''
+    player, field = game.player, game.game_field
+    if player.weapon is None:
+        for slot, item in player.inventory.slots.items():
+            if isinstance(item, Weapon):
+                return pygame.K_f if player.inventory.selected == slot else SLOT_KEYS[slot]
+        if any(isinstance(item, Weapon) for item in field.get_tile(player.pos).items):
+            return pygame.K_p
+        armouries = sorted((manhattan_distance(player.pos, pos), pos) for pos, items in field.item_piles()
+                           if any(isinstance(item, Weapon) for item in items))
+        for _, pos in armouries:
+            key = _step_key(game, pos)
+            if key is not None:
+                return key
+
+    for enemy in field.entities_near(player.pos, game.scheduler.wake_range):
+        if enemy is not player:
+            key = _step_key(game, enemy.pos)
+            if key is not None:
+                return key
+    return game.random_key()
+
+POLICIES = {
+    'random': HeadlessGame.random_key,
+    'greedy': greedy_key,
+}
+
+def level_runs(runs: int, seed: np.random.SeedSequence, policy: str, width: int, height: int, enemies: int, items: int,
+               dungeon: bool, overrides=(), max_turns: int = MAX_TURNS) -> dict:
+    '''runs whole levels under a player policy, per run outcome arrays'''
+    item_types, enemy_types, _ = prototypes(overrides)
+    choose = POLICIES[policy]
+    seeds = seed.generate_state(runs).tolist()
+    won = np.zeros(runs, dtype=bool)
+    timeout = np.zeros(runs, dtype=bool)
+    turns = np.zeros(runs, dtype=np.int32)
+    hp_lost = np.zeros(runs)
+    kills = np.zeros(runs, dtype=np.int32)
+    for run, run_seed in enumerate(seeds):
+        game = HeadlessGame(width, height, enemies, items, seed=run_seed, dungeon=dungeon,
+                            prototypes=(item_types, enemy_types))
+        start = game.player.health
+        while len(game.scheduler) and game.turn < max_turns and game.step(choose(game)):
+            pass
+        won[run] = game.player.health > 0 and not len(game.scheduler)
+        timeout[run] = game.player.health > 0 and not won[run]
+        turns[run] = game.turn
+        hp_lost[run] = start - max(0, game.player.health)
+        kills[run] = enemies - len(game.scheduler)
+    return {'won': won, 'timeout': timeout, 'turns': turns, 'hp_lost': hp_lost, 'kills': kills}
+
+def _spread(values: np.ndarray) -> dict:
+    if not len(values):
+        return {'mean': None, 'p10': None, 'p50': None, 'p90': None}
+    p10, p50, p90 = np.percentile(values, (10, 50, 90)).tolist()
+    return {'mean': float(values.mean()), 'p10': p10, 'p50': p50, 'p90': p90}
+
+def summarize(outcomes: dict) -> dict:
+    won = outcomes['won']
+    summary = {
+        'runs': len(won),
+        'win_rate': float(won.mean()),
+        'timeouts': int(outcomes['timeout'].sum()),
+        'turns_to_win': _spread(outcomes['turns'][won]),
+        'hp_lost': _spread(outcomes['hp_lost']),
+    }
+    if 'kills' in outcomes:
+        summary['kills'] = _spread(outcomes['kills'])
+    return summary
+
+def _tasks(total: int, size: int, seed) -> list[tuple[int, np.random.SeedSequence]]:
+    '''Fixed size chunks of total, each with a stream spawned from seed (an int or a SeedSequence)'''
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    counts = [size] * (total // size) + ([total % size] if total % size else [])
+    return list(zip(counts, seed.spawn(len(counts))))
+
+def _merge(parts: list[dict]) -> dict:
+    return {field: np.concatenate([part[field] for part in parts]) for field in parts[0]}
+
+def run_duels(pool, weapons, enemies, fights: int, seed: int, overrides, max_turns: int) -> dict:
+    futures = {}
+    matchups = [(w, e) for w in weapons for e in enemies]
+    # One independent stream per matchup, the tasks of a matchup are spawned from it
+    for (weapon, enemy), matchup_seed in zip(matchups, np.random.SeedSequence(seed).spawn(len(matchups))):
+        futures[weapon, enemy] = [pool.submit(duels, weapon, enemy, count, task_seed, overrides, max_turns)
+                                  for count, task_seed in _tasks(fights, TASK_SIZE, matchup_seed)]
+    return {f'{weapon} vs {enemy}': summarize(_merge([future.result() for future in parts]))
+            for (weapon, enemy), parts in futures.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Seeded balance simulations over all cores')
+    parser.add_argument('--mode', choices=('duel', 'level'), default='duel')
+    parser.add_argument('--weapons', nargs='+', help='player weapons for duels, all of them by default')
+    parser.add_argument('--enemies', nargs='+', help='enemy types for duels, all of them by default')
+    parser.add_argument('--fights', type=int, default=10000, help='duels per matchup')
+    parser.add_argument('--set', dest='overrides', nargs='+', default=[], metavar='NAME.FIELD=VALUE',
+                        help='prototype stat overrides, e.g. Sword.damage=20 Troll.armor=30')
+    parser.add_argument('--policy', choices=tuple(POLICIES), default='greedy')
+    parser.add_argument('--runs', type=int, default=100, help='level runs')
+    parser.add_argument('--width', type=int, default=30)
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--level-enemies', type=int, default=3)
+    parser.add_argument('--level-items', type=int, default=8)
+    parser.add_argument('--dungeon', action='store_true')
+    parser.add_argument('--max-turns', type=int, default=MAX_TURNS)
+    parser.add_argument('--workers', type=int, default=None, help='processes, all cores by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    overrides = parse_overrides(args.overrides)
+    items, enemies, _ = prototypes(overrides)
+    weapons = args.weapons or [name for name, item in items.items() if isinstance(item, Weapon)]
+    foes = args.enemies or list(enemies)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        if args.mode == 'duel':
+            results = run_duels(pool, weapons, foes, args.fights, args.seed, overrides, args.max_turns)
+        else:
+            parts = [pool.submit(level_runs, count, task_seed, args.policy, args.width, args.height,
+                                 args.level_enemies, args.level_items, args.dungeon, overrides, args.max_turns)
+                     for count, task_seed in _tasks(args.runs, max(1, TASK_SIZE // 200), args.seed)]
+            results = {f'{args.policy} {args.width}x{args.height}': summarize(_merge([p.result() for p in parts]))}
+    elapsed = time.perf_counter() - start
+
+    for name, summary in results.items():
+        turns, hp = summary['turns_to_win'], summary['hp_lost']
+        turns_text = f"{turns['p50']:.0f} turns to win (p90 {turns['p90']:.0f})" if turns['p50'] is not None else 'never won'
+        print(f"{name:28} win {summary['win_rate']:6.1%}  {turns_text:28} "
+              f"hp lost {hp['mean']:5.1f} (p90 {hp['p90']:.0f})  {summary['timeouts']} timeouts")
+    print(f'{elapsed:.2f}s')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
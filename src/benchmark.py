@@ -0,0 +1,233 @@
+'''Turn throughput, pathfinding and render timings across map sizes and enemy counts.
+
+    python benchmark.py                          # the full matrix, takes a while
+    python benchmark.py --sizes 30x20 100x100 --enemies 3 50 --json bench.json
+    python benchmark.py --pathfinding astar --sizes 100x100 --enemies 50
+    python benchmark.py --check-combat 40000    # resolve_attacks against Entity._attack, no timings
+    python benchmark.py --check-paths           # cached A* paths get patched, not replanned
+'''
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import numpy as np
+from headless import HeadlessGame, placeholder_sprites
+from entities.entity import Direction
+from entities.player import Player
+from entities.enemy import Enemy, PATHFINDING_MODES
+from items.weapon import Weapon
+from systems.combat import resolve_attacks, weapon_arrays, target_arrays
+from systems.gamefield import GameField, WALL
+from utils.functions import manhattan_distance
+from utils.constants import FLOW_DETOUR_MARGIN
+from systems.savegame import save_game, load_game
+
+SIZES = ((30, 20), (100, 100), (250, 250), (500, 500))
+ENEMY_COUNTS = (3, 50, 500, 5000)
+# Target stats compared by check_combat
+COMBAT_STATS = ('health', 'armor', 'stun_time', 'bleeding_time')
+
+def _timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+def bench_turns(game: HeadlessGame, turns: int) -> float:
+    '''Turns per second under the random policy, the player can't die'''
+    game.player.health = 10 ** 9
+    elapsed = _timed(game.run, turns)
+    return game.turn / elapsed
+
+def bench_pathfinding(game: HeadlessGame, samples: int) -> dict:
+    '''Average ms per query from random free tiles towards the player'''
+    field = game.game_field
+    free = np.flatnonzero(field.collision == 0).tolist()
+    starts = [divmod(i, field.width) for i in game.rng.sample(free, min(samples, len(free)))]
+    goal = (game.player.pos[0], game.player.pos[1])
+    radius = max(enemy.detection_range for enemy in game.enemy_types.values()) + FLOW_DETOUR_MARGIN
+    times = {'distance_field': 0.0, 'astar': 0.0, 'bfs': 0.0}
+    for start in starts:
+        field._flow_key = None  # force a fresh field every sample
+        times['distance_field'] += _timed(field.distance_field, goal, radius)
+        times['astar'] += _timed(field.astar_path, start, goal)
+        times['bfs'] += _timed(field.bfs_path, start, goal)
+    return {name: 1000 * total / max(1, len(starts)) for name, total in times.items()}
+
+def bench_render(game: HeadlessGame, frames: int) -> dict:
+    '''Average ms for a full repaint and for the incremental repaint after a turn'''
+    full = incremental = 0.0
+    for _ in range(frames):
+        game.game_field.invalidate()
+        full += _timed(game.render)
+        game.step(game.random_key())
+        incremental += _timed(game.render)
+    return {'full': 1000 * full / frames, 'incremental': 1000 * incremental / frames}
+
+def bench_save_load(game: HeadlessGame) -> dict:
+    '''ms to save and to load the whole world, plus the file size in KB'''
+    sprites = placeholder_sprites()
+    player = Player(sprites['Player'], sprites['Inventory_slot'], sprites['Selected_slot'])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sav')
+        save = _timed(save_game, path, game.game_field, game.player, game.scheduler)
+        load = _timed(load_game, path, game.game_field._terrain_images, player,
+                      game.item_types, game.enemy_types)
+        size = os.path.getsize(path)
+    return {'save': 1000 * save, 'load': 1000 * load, 'size_kb': size / 1024}
+
+def check_combat(game: HeadlessGame, samples: int, seed: int) -> list[str]:
+    '''Mean outcome of samples Entity._attack calls against resolve_attacks, for every weapon
+    and enemy type. Returns the stats that are more than 5 standard errors apart'''
+    attacker = game.player
+    attacker.rng.seed(seed)
+    failures = []
+    for weapon in [item for item in game.item_types.values() if isinstance(item, Weapon)]:
+        attacker.weapon = weapon
+        for enemy_type in game.enemy_types.values():
+            scalar = {stat: np.empty(samples) for stat in COMBAT_STATS}
+            for i in range(samples):
+                target = enemy_type.spawn((0, 0))
+                attacker._attack(target)
+                for stat in COMBAT_STATS:
+                    scalar[stat][i] = getattr(target, stat)
+            batch = resolve_attacks(weapon_arrays([weapon] * samples),
+                                    target_arrays([enemy_type.spawn((0, 0))] * samples), rng=seed)
+            for stat in COMBAT_STATS:
+                a, b = scalar[stat], batch[stat]
+                error = np.sqrt((a.var() + b.var()) / samples)
+                if abs(a.mean() - b.mean()) > 5 * error + 1e-9:
+                    failures.append(f'{weapon.name} vs {enemy_type.name}: {stat} {a.mean():.3f} != {b.mean():.3f}')
+    attacker.weapon = None
+    return failures
+
+# Walls dropped across a straight cached path by check_path_repair, (row, col) going south 5 tiles
+PATH_REPAIR_CASES = (((8, 15),), ((8, 8), (8, 15)))
+
+def check_path_repair(game: HeadlessGame) -> list[str]:
+    '''Drops walls across an enemy's cached A* path, the next step must come from local
+    detours (budgeted searches only) that leave a walkable path, and the enemy must still
+    reach the player'''
+    failures = []
+    mode, Enemy.pathfinding = Enemy.pathfinding, 'astar'
+    try:
+        for walls in PATH_REPAIR_CASES:
+            failures += [f'walls at {walls}: {failure}' for failure in _check_path_repair(game, walls)]
+    finally:
+        Enemy.pathfinding = mode
+    return failures
+
+def _check_path_repair(game: HeadlessGame, walls) -> list[str]:
+    sprites = placeholder_sprites()
+    field = GameField(sprites['Floor'], 40, 20)
+    player = game.player
+    player.pos = [10, 30]
+    field.place_entity(player.pos, player)
+    enemy = game.enemy_types['Goblin'].spawn((10, 2))
+    field.place_entity(enemy.pos, enemy)
+
+    searches = []
+    astar_path = field.astar_path
+    def recorded(*args, **kwargs):
+        searches.append(kwargs)
+        return astar_path(*args, **kwargs)
+    field.astar_path = recorded
+
+    enemy.move_towards(player, field)
+    failures = [] if enemy.pos == [10, 3] else [f'first turn: moved to {enemy.pos}, expected [10, 3]']
+    for row, col in walls:
+        field.add_wall(sprites['Wall'], row, col, Direction.SOUTH, 5)
+    searches.clear()
+    enemy.move_towards(player, field)
+
+    if any('max_length' in search for search in searches):
+        failures.append('blocked path was planned again from scratch')
+    if not searches:
+        failures.append('blocked path was not searched again')
+    if enemy.pos != [10, 4]:
+        failures.append(f'second turn: moved to {enemy.pos}, expected [10, 4]')
+    path = [tuple(enemy.pos)] + list(enemy._path or ())
+    if path[-1] != (10, 30):
+        failures.append(f'patched path ends at {path[-1]}, not on the player')
+    if any(field.collision[pos] & WALL for pos in path):
+        failures.append('patched path runs through a wall')
+    if any(manhattan_distance(a, b) != 1 for a, b in zip(path, path[1:])):
+        failures.append('patched path has gaps')
+
+    for _ in range(2 * len(path)):
+        if manhattan_distance(enemy.pos, player.pos) == 1:
+            break
+        enemy.move_towards(player, field)
+    else:
+        failures.append(f'stuck at {enemy.pos} on the way to the player')
+    return failures
+
+def run_case(width: int, height: int, enemies: int, turns: int, samples: int, frames: int, seed: int) -> dict:
+    start = time.perf_counter()
+    game = HeadlessGame(width, height, enemies, items=enemies, seed=seed)
+    setup = time.perf_counter() - start
+    return {
+        'width': width, 'height': height, 'enemies': enemies, 'pathfinding': Enemy.pathfinding,
+        'setup_ms': 1000 * setup,
+        'turns_per_sec': bench_turns(game, turns),
+        'path_ms': bench_pathfinding(game, samples),
+        'render_ms': bench_render(game, frames),
+        'save_load': bench_save_load(game),
+    }
+
+def _size(text: str) -> tuple[int, int]:
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless benchmark suite')
+    parser.add_argument('--sizes', type=_size, nargs='+', default=SIZES, help='e.g. 30x20 500x500')
+    parser.add_argument('--enemies', type=int, nargs='+', default=ENEMY_COUNTS)
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=5, help='pathfinding queries per case')
+    parser.add_argument('--frames', type=int, default=20, help='rendered frames per case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--pathfinding', choices=PATHFINDING_MODES, default=Enemy.pathfinding,
+                        help='how enemies chase the player')
+    parser.add_argument('--check-combat', type=int, metavar='SAMPLES',
+                        help='only check resolve_attacks against Entity._attack with this many attacks per pair')
+    parser.add_argument('--check-paths', action='store_true',
+                        help='only check that blocked A* paths are patched locally instead of replanned')
+    args = parser.parse_args()
+
+    if args.check_combat or args.check_paths:
+        game = HeadlessGame(seed=args.seed)
+        failures = check_path_repair(game) if args.check_paths else []
+        if args.check_combat:
+            failures += check_combat(game, args.check_combat, args.seed)
+        print('\n'.join(failures) or 'checks passed')
+        return 1 if failures else 0
+
+    Enemy.pathfinding = args.pathfinding
+
+    print(f'{"map":>9} {"enemies":>7} {"turns/s":>9} {"field ms":>9} {"A* ms":>8} {"BFS ms":>8} '
+          f'{"full ms":>8} {"incr ms":>8} {"save ms":>8} {"load ms":>8}')
+    results = []
+    for width, height in args.sizes:
+        for enemies in args.enemies:
+            # Leave most of the map walkable
+            if enemies > width * height // 10:
+                continue
+            case = run_case(width, height, enemies, args.turns, args.samples, args.frames, args.seed)
+            results.append(case)
+            path, render, saves = case['path_ms'], case['render_ms'], case['save_load']
+            print(f'{width:>4}x{height:<4} {enemies:>7} {case["turns_per_sec"]:>9.0f} '
+                  f'{path["distance_field"]:>9.2f} {path["astar"]:>8.2f} {path["bfs"]:>8.2f} '
+                  f'{render["full"]:>8.2f} {render["incremental"]:>8.2f} '
+                  f'{saves["save"]:>8.2f} {saves["load"]:>8.2f}', flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,29 @@
+from collections import deque
 from entities.entity import Entity, Direction
 from utils.functions import manhattan_distance
-from random import choice, randint
+from utils.constants import MAX_PATH_LENGTH, PATH_REPAIR_EXPANSIONS, FLOW_DETOUR_MARGIN
 from items.weapon import Weapon
+from systems.profiler import profiler
+from systems.gamefield import WALL, ENTITY
+
+PATHFINDING_MODES = ('flow', 'astar', 'bfs')
 
 class Enemy(Entity):
+    # 'flow' steps along the field shared by all enemies, 'bfs' and 'astar' follow their own path
+    pathfinding = 'flow'
+
+    # _path is a deque of tiles ending on the target, valid for walls as of _path_version
+    __slots__ = ('_path', '_path_version', '_idle_state_wait_time')
+
     def __init__(self, name: str, health: int, armor: int, dodge_chance: float, pos: list[int], 
-                 surf, weapon: Weapon, detection_range: int) -> None:
-        super().__init__(name, health, armor, dodge_chance, pos, surf, weapon, detection_range)
+                 surf, weapon: Weapon, detection_range: int, rng=None) -> None:
+        super().__init__(name, health, armor, dodge_chance, pos, surf, weapon, detection_range, rng)
+
+    def _init_state(self, pos: list[int], rng=None) -> None:
+        super()._init_state(pos, rng)
         self._path = None
-        self.weapon = weapon
-        self._idle_state_wait_time = randint(1, 3)
+        self._path_version = None
+        self._idle_state_wait_time = self.rng.randint(1, 3)
 
     def act(self, target: Entity, game_field) -> None:
         if self.visual_contact(target, game_field):
@@ -19,50 +33,122 @@ class Enemy(Entity):
             else:
                 self.move_towards(target, game_field)
         else:
-            if self._idle_state_wait_time:
-                self._idle_state_wait_time -= 1
-            else:
-                self._move_idle(game_field)
-                self._idle_state_wait_time = randint(1,3)
+            self.idle(game_field)
+
+    @property
+    def idle_wait(self) -> int:
+        '''Turns left before the next wandering step'''
+        return self._idle_state_wait_time
+
+    @idle_wait.setter
+    def idle_wait(self, turns: int) -> None:
+        self._idle_state_wait_time = turns
+
+    def idle(self, game_field) -> None:
+        '''Wandering without looking for the player, for enemies known to be out of range'''
+        if self._idle_state_wait_time:
+            self._idle_state_wait_time -= 1
+        else:
+            self._move_idle(game_field)
+            self._idle_state_wait_time = self.rng.randint(1,3)
 
     def visual_contact(self, target: Entity, game_field) -> bool:
         if manhattan_distance(self.pos, target.pos) > self.detection_range:
             return False
 
-        r, c = self.pos
-        tr, tc = target.pos
-        while (r, c) != (tr, tc):
-            dr = 1 if r < tr else -1 if r > tr else 0
-            dc = 1 if c < tc else -1 if c > tc else 0
-            r += dr
-            c += dc
-            tile = game_field.get_tile((r, c))
-            if tile.have_collision and tile.entity is None:
-                return False
-        return True
+        # Sight is symmetric, so one field of view around the target serves every enemy
+        with profiler.phase('sight'):
+            return (self.pos[0], self.pos[1]) in game_field.visible_tiles(target.pos, self.detection_range)
 
     def move_towards(self, target: Entity, game_field) -> None:
-        if self._path:
-            next_pos = self._path.pop(0)
-            self.set_pos(next_pos, game_field)
-        elif self.visual_contact(target, game_field):
-            self._update_path(target, game_field)
+        with profiler.phase('path'):
+            if self.pathfinding == 'flow':
+                next_pos = game_field.next_step(self.pos, target.pos, self.detection_range + FLOW_DETOUR_MARGIN)
+            elif self._path:
+                next_pos = self._next_on_path(target, game_field)
+            else:
+                # Planned this turn, the first step is still taken this turn
+                next_pos = self._replan(target, game_field)
+        if next_pos is None:
+            return
+        self.set_pos(next_pos, game_field)
+        if self._path and (self.pos[0], self.pos[1]) == next_pos:
+            self._path.popleft()
+
+    def _next_on_path(self, target: Entity, game_field):
+        '''Next tile of the cached path after patching it up, None to wait a turn.
+        Only the broken part of the path gets searched again, with a small A* budget'''
+        cells, w = game_field._cells, game_field.width
+        if self._path_version != game_field.terrain_version:
+            self._path_version = game_field.terrain_version
+            # Every blocked run gets its own detour, the scan carries on after each one
+            i = 0
+            while i < len(self._path):
+                r, c = self._path[i]
+                if cells[r * w + c] & WALL and not self._splice(game_field, i, WALL):
+                    return self._replan(target, game_field)
+                i += 1
+
+        # The target moved, extend the path from where it used to stand
+        goal = (target.pos[0], target.pos[1])
+        if self._path[-1] != goal:
+            if goal in self._path:
+                while self._path[-1] != goal:
+                    self._path.pop()
+            else:
+                tail = game_field.astar_path(self._path[-1], goal, max_expansions=PATH_REPAIR_EXPANSIONS)
+                if tail is None:
+                    return self._replan(target, game_field)
+                self._path.extend(tail)
+
+        # Someone is standing in the way, step around them or wait for them to move.
+        # Walls don't move, if there is no way around one the path is planned again
+        r, c = self._path[0]
+        if cells[r * w + c] & (WALL | ENTITY) and not self._splice(game_field, 0, WALL | ENTITY):
+            return self._replan(target, game_field) if cells[r * w + c] & WALL else None
+        return self._path[0]
+
+    def _splice(self, game_field, i: int, blocking: int) -> bool:
+        '''Reroutes the path around the blocked tiles starting at index i, to the first free one
+        after them. False if there is no free tile left to rejoin or no detour within budget'''
+        cells, w = game_field._cells, game_field.width
+        path = list(self._path)
+        j = next((j for j in range(i + 1, len(path)) if not cells[path[j][0] * w + path[j][1]] & blocking), None)
+        if j is None:
+            return False
+        start = path[i - 1] if i else (self.pos[0], self.pos[1])
+        detour = game_field.astar_path(start, path[j], max_expansions=PATH_REPAIR_EXPANSIONS, blocking=blocking)
+        if detour is None:
+            return False
+        self._path = deque(path[:i] + detour + path[j + 1:])
+        return True
+
+    def _replan(self, target: Entity, game_field):
+        self._update_path(target, game_field)
+        return self._path[0] if self._path else None
 
     def _move_idle(self, game_field):
-        d = choice(list(Direction))
+        d = self.rng.choice(list(Direction))
         r, c = self.pos
         next_pos = r+d.value[0], c+d.value[1]
+        if not (0 <= next_pos[0] < game_field.height and 0 <= next_pos[1] < game_field.width):
+            return
         tile = game_field.get_tile(next_pos)
         if not tile.have_collision and tile.entity is None:
             self.set_pos(next_pos, game_field)  # type: ignore
+            self._path = None  # it started where we no longer are
 
 
     def _update_path(self, target: Entity, game_field) -> None:
         start = tuple(self.pos)
         goal = tuple(target.pos)
-        self._path = game_field.bfs_path(start, goal)
+        if self.pathfinding == 'astar':
+            path = game_field.astar_path(start, goal, max_length=MAX_PATH_LENGTH)
+        else:
+            path = game_field.bfs_path(start, goal)
+        self._path = deque(path) if path else None
+        self._path_version = game_field.terrain_version
 
     def die(self, game_field) -> None:
-        game_field.get_tile(self.pos).entity = None
-        game_field.get_tile(self.pos).have_collision = False
+        game_field.remove_entity(self.pos)
         
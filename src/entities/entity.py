@@ -1,7 +1,9 @@
 from enum import Enum
+from typing import NamedTuple, Optional
 from items.weapon import Weapon
 from utils.constants import BLEEDING_DAMAGE, STUN_TIME, BLEEDING_TIME
-from random import random
+import random
+from systems.events import bus, Event
 
 class Direction(Enum):
     NORTH = (-1, 0)
@@ -9,22 +11,124 @@ class Direction(Enum):
     SOUTH = (1, 0)
     WEST = (0, -1)
 
+class EntityType(NamedTuple):
+    '''Static data shared by every entity of a kind, plus its starting stats'''
+    name: str
+    surf: object
+    dodge_chance: float
+    detection_range: int
+    health: int
+    armor: int
+    weapon: Optional[Weapon]
+
 class Entity:
+    # Only per-instance state lives here, the rest is in proto
+    __slots__ = ('proto', '_health', '_armor', '_pos', '_weapon', '_stun_time', '_bleeding_time', 'stunned', 'rng')
+    # Used by entities that weren't given a generator of their own
+    default_rng = random.Random()
+
     def __init__(self, name: str, health: int, armor: int, dodge_chance: float, pos: list[int], 
-                 surf, weapon: Weapon, detection_range: int) -> None:
-        self.name = name
-        self.health = health
-        self.armor = armor
-        self.pos = pos
-        self.surf = surf
-        self.weapon = weapon
-        self.detection_range = detection_range
-        self.dodge_chance = dodge_chance
+                 surf, weapon: Weapon, detection_range: int, rng: random.Random | None = None) -> None:
+        self.proto = EntityType(name, surf, dodge_chance, detection_range, health, armor, weapon)
+        self._init_state(pos, rng)
+
+    def _init_state(self, pos: list[int], rng: random.Random | None = None) -> None:
+        # Every combat and wandering roll comes from here, give all entities of a run
+        # the same seeded generator to make the run reproducible
+        self.rng = rng if rng is not None else Entity.default_rng
+        self._health = self.proto.health
+        self._armor = self.proto.armor
+        self._pos = pos
+        self._weapon = self.proto.weapon
         # Combat 
-        self.stun_time = 0
-        self.bleeding_time = 0
+        self._stun_time = 0
+        self._bleeding_time = 0
         self.stunned = False  # only influences the ability to attack
 
+    def spawn(self, pos: list[int], rng: random.Random | None = None):
+        '''New entity of the same type, with fresh state'''
+        entity = type(self).__new__(type(self))
+        entity.proto = self.proto
+        entity._init_state(list(pos), rng)
+        return entity
+
+    @property
+    def name(self) -> str:
+        return self.proto.name
+
+    @property
+    def surf(self):
+        return self.proto.surf
+
+    @property
+    def dodge_chance(self) -> float:
+        return self.proto.dodge_chance
+
+    @property
+    def detection_range(self) -> int:
+        return self.proto.detection_range
+
+    # State the UI shows is exposed through properties that emit change events
+
+    @property
+    def health(self):
+        return self._health
+
+    @health.setter
+    def health(self, value) -> None:
+        if value != self._health:
+            self._health = value
+            bus.emit(Event.HEALTH_CHANGED, self)
+
+    @property
+    def armor(self):
+        return self._armor
+
+    @armor.setter
+    def armor(self, value) -> None:
+        if value != self._armor:
+            self._armor = value
+            bus.emit(Event.ARMOR_CHANGED, self)
+
+    @property
+    def pos(self) -> list[int]:
+        return self._pos
+
+    @pos.setter
+    def pos(self, value) -> None:
+        old = self._pos
+        self._pos = value
+        bus.emit(Event.POS_CHANGED, self, old=old, pos=value)
+
+    @property
+    def weapon(self):
+        return self._weapon
+
+    @weapon.setter
+    def weapon(self, value) -> None:
+        if value is not self._weapon:
+            self._weapon = value
+            bus.emit(Event.WEAPON_CHANGED, self)
+
+    @property
+    def stun_time(self) -> int:
+        return self._stun_time
+
+    @stun_time.setter
+    def stun_time(self, value: int) -> None:
+        if value != self._stun_time:
+            self._stun_time = value
+            bus.emit(Event.EFFECTS_CHANGED, self)
+
+    @property
+    def bleeding_time(self) -> int:
+        return self._bleeding_time
+
+    @bleeding_time.setter
+    def bleeding_time(self, value: int) -> None:
+        if value != self._bleeding_time:
+            self._bleeding_time = value
+            bus.emit(Event.EFFECTS_CHANGED, self)
 
     def _attack(self, target: 'Entity') -> None:
         if self.stunned:
@@ -33,26 +137,26 @@ class Entity:
         if self.weapon is None:
             return
 
-        target_did_dodge = random() < target.dodge_chance
+        target_did_dodge = self.rng.random() < target.dodge_chance
         if target_did_dodge:
-            print(f'{self.name}: dodged')
+            bus.emit(Event.ATTACK_DODGED, self, target=target)
             return
 
         damage = self.weapon.damage
         armor = target.armor
         penetration = self.weapon.armor_penetration
 
-        is_critical = random() < self.weapon.critical_hit_chance
+        is_critical = self.rng.random() < self.weapon.critical_hit_chance
         if is_critical:
-            print(f'{self.name}: critical')
+            bus.emit(Event.CRITICAL_HIT, self, target=target)
             damage *= 1.5
 
-        is_stunning = random() < self.weapon.stun_chance
+        is_stunning = self.rng.random() < self.weapon.stun_chance
         if is_stunning:
             target.stun_time = STUN_TIME
             target.stunned = True
 
-        is_bleedy = random() < self.weapon.bleeding_chance
+        is_bleedy = self.rng.random() < self.weapon.bleeding_chance
         if is_bleedy:
             target.bleeding_time += BLEEDING_TIME
 
@@ -74,14 +178,7 @@ class Entity:
             0 <= next_pos[1] < game_field.width): # type: ignore
             tile = game_field.get_tile(next_pos)
             if not tile.have_collision:
-                current_tile = game_field.get_tile(self.pos)
-                current_tile.entity = None
-                current_tile.have_collision = False
-                
-                self.pos = list(next_pos)
-                new_tile = game_field.get_tile(self.pos)
-                new_tile.entity = self
-                new_tile.have_collision = True
+                game_field.move_entity(self, next_pos)
 
     def apply_effects(self) -> None:
         if self.bleeding_time > 0:
@@ -94,6 +191,16 @@ class Entity:
             self.stunned = False
 
 
+    def catch_up_effects(self, turns: int) -> None:
+        '''Same as calling apply_effects() turns times'''
+        if turns <= 0:
+            return
+        bled = min(self.bleeding_time, turns)
+        self.bleeding_time -= bled
+        self.health -= bled * BLEEDING_DAMAGE
+        self.stunned = self.stun_time >= turns
+        self.stun_time = max(0, self.stun_time - turns)
+
     @staticmethod
     def manhattan_distance(pos1, pos2) -> int:
         return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
\ No newline at end of file
@@ -3,9 +3,11 @@ from systems.inventory import Inventory
 from items.weapon import Weapon
 
 class Player(Entity):
-    def __init__(self, surf, inv_slot_img, selected_slot_img) -> None:
+    __slots__ = ('inventory',)
+
+    def __init__(self, surf, inv_slot_img, selected_slot_img, rng=None) -> None:
         super().__init__(name='Player', health=100, armor=30, dodge_chance=0.2, pos=[0, 0], 
-                         surf=surf, weapon=None, detection_range=10)  # type: ignore
+                         surf=surf, weapon=None, detection_range=10, rng=rng)  # type: ignore
         self.inventory = Inventory(10, inv_slot_img, selected_slot_img)
 
     def attack(self, target) -> None:
@@ -18,14 +20,14 @@ class Player(Entity):
             "pos": self.pos
         }
 
-    def get_env_info(self, game_field, enemies) -> dict:
+    def get_env_info(self, game_field) -> dict:
         env_info = {}
         current_tile = game_field.get_tile(self.pos)
         items_around = [item.name for item in current_tile.items]
         
         enemies_around = [
-            enemy.name for enemy in enemies 
-            if self.manhattan_distance(self.pos, enemy.pos) <= self.detection_range
+            enemy.name for enemy in game_field.entities_near(self.pos, self.detection_range)
+            if enemy is not self
         ]
         
         if items_around:
@@ -1,15 +1,22 @@
+import os
 import pygame
+import random
 import sys
+from collections import deque
 from utils import constants as const
-from utils.functions import load_sprite
 from entities.player import Player
 from entities.enemy import Enemy
 from items.item import Item
 from items.weapon import Weapon
 from systems.gamefield import GameField
+from systems.levels import load_level, LEVELS_DIR
+from systems.assets import Atlas
 from systems.statusbar import Statusbar
+from systems.scheduler import TurnScheduler
+from systems.events import bus, Event
+from systems.profiler import profiler
+from systems.replay import Replay, ReplayError
 from entities.entity import Direction
-from copy import copy
 
 def use_heal_potion(p: Player, *args):  # DAMN this works
     p.health = min(100, p.health + 30)
@@ -19,33 +26,13 @@ def use_armor_potion(p: Player, *args):  # DAMN this works
 
 def equip(p: Player, g: GameField, w: Weapon, *args):
     if p.weapon is not None:
-        g.get_tile(p.pos).items.append(p.weapon) 
+        g.drop_item(p.pos, p.weapon)
     p.weapon = w
 
-def load_level(player, game_field, statusbar, items: dict['Item', tuple[int, int]], 
-               wall_img, walls_pos: list[tuple[int, int, Direction, int]], 
-               enemies: dict[Enemy, tuple[int, int]]) -> tuple[GameField, list[Enemy]]:
-    '''Returns level configuration'''
-    game_field.get_tile(player.pos).entity = player
+SLOT_KEYS = [pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5,
+             pygame.K_6, pygame.K_7, pygame.K_8, pygame.K_9, pygame.K_0]
 
-    for enemy, pos in enemies.items():
-        enemy.set_pos(pos, game_field) # type: ignore
-        game_field.get_tile(pos).entity = enemy
-        game_field.get_tile(pos).have_collision = True
-
-    for item, pos in items.items():
-        game_field.get_tile(pos).items.append(item)
-
-    for wall in walls_pos:
-        game_field.add_wall(wall_img, *wall)
-
-    enemies_list = list(enemies.keys())
-    statusbar.enemies = enemies_list
-
-    return game_field, enemies_list
-
-
-def handle_input(key, player, enemies, game_field):
+def handle_input(key, player, game_field):
         
     # Movement
     movements = {
@@ -63,17 +50,17 @@ def handle_input(key, player, enemies, game_field):
         dr, dc = movements[key].value
         new_pos = [player.pos[0] + dr, player.pos[1] + dc]
         if (0 <= new_pos[0] < game_field.height) and (0 <= new_pos[1] < game_field.width):
-            if game_field.get_tile(new_pos).entity:
-                e = game_field.get_tile(new_pos).entity
+            e = game_field.entity_at(new_pos)
+            if e:
                 player.attack(e)
             else:
                 player.set_pos(new_pos, game_field)
 
     # Item interactions
     elif key == pygame.K_p:
-        tile = game_field.get_tile(player.pos)
-        if tile.items:
-            player.inventory.add_item(tile.items.pop())
+        item = game_field.pick_item(player.pos)
+        if item is not None:
+            player.inventory.add_item(item)
 
     elif key == pygame.K_f:
         slot = player.inventory.selected
@@ -84,136 +71,183 @@ def handle_input(key, player, enemies, game_field):
                 player.inventory.remove_item(slot)
     
     elif key == pygame.K_g:
-        slot = player.inventory.selected
-        if slot in player.inventory.slots:
-            item = player.inventory.slots[slot]
-            game_field.get_tile(player.pos).items.append(item)
-            player.inventory.remove_item(slot)
-    
-    # Inventory selection
-    for i, k in enumerate([pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5,
-                            pygame.K_6, pygame.K_7, pygame.K_8, pygame.K_9, pygame.K_0]):
-        if k == pygame.K_0:
-            slot = 10
-        else:
-            slot = i + 1
-            
-        if key == k:
-            player.inventory.selected = slot
-
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((const.WIDTH, const.HEIGHT))
-    pygame.display.set_caption("GAME!")
-    
-    # Load assets
-    BLANK_SURF = pygame.Surface((const.TILE_SIZE, const.TILE_SIZE))
-    BLANK_SURF.fill(const.BLACK)
-    
-    PLAYER_IMG = load_sprite('Player')
-    INV_SLOT_IMG = load_sprite('Inventory_slot')
-    SELECTED_SLOT_IMG = load_sprite('Selected_slot')
-    FLOOR_IMG = load_sprite('Floor')
-    SWORD_IMG = load_sprite('Sword')
-    KNIFE_IMG = load_sprite('Knife')
-    AXE_IMG = load_sprite('Axe')
-    SLEDGEHAMMER_IMG = load_sprite('Sledgehammer')
-    HEAL_POTION_IMG = load_sprite('HealPotion')
-    ARMOR_POTION_IMG = load_sprite('ArmorPotion')
-    WALL_IMG = load_sprite('Wall')
-
-    
-    FONT = pygame.font.Font(None, 30)
+        item = player.inventory.take(player.inventory.selected)
+        if item is not None:
+            game_field.drop_item(player.pos, item)
     
+    # Inventory selection, number keys pick a slot on the shown page, page up/down flip pages
+    inventory = player.inventory
+    if key in SLOT_KEYS:
+        slot = inventory.page_start() + SLOT_KEYS.index(key)
+        if slot <= inventory.capacity:
+            inventory.selected = slot
+    elif key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+        step = const.INV_PAGE_SIZE if key == pygame.K_PAGEDOWN else -const.INV_PAGE_SIZE
+        inventory.selected = min(max(1, inventory.selected + step), inventory.capacity)
+
+REPLAYS_DIR = LEVELS_DIR.parent / 'replays'
+
+# Sprite files under sprites/, packed into one atlas at startup
+SPRITES = ('Player', 'Inventory_slot', 'Selected_slot', 'Floor', 'Sword', 'Knife', 'Axe',
+           'Sledgehammer', 'HealPotion', 'ArmorPotion', 'Wall')
+
+def create_prototypes(sprites: dict, blank_surf) -> tuple[dict[str, Item], dict[str, Enemy]]:
+    '''Item and enemy prototypes by name, levels spawn() them'''
     # Create items
-    heal_potion = Item('Heal potion', HEAL_POTION_IMG, 'Heals 30 HP', use=use_heal_potion)
-    armor_potion = Item('Armor potion', ARMOR_POTION_IMG, 'Adds 30 armor points', use=use_armor_potion)
-    sword = Weapon('Sword', SWORD_IMG, 'A sharp sword', 
+    heal_potion = Item('Heal potion', sprites['HealPotion'], 'Heals 30 HP', use=use_heal_potion)
+    armor_potion = Item('Armor potion', sprites['ArmorPotion'], 'Adds 30 armor points', use=use_armor_potion)
+    sword = Weapon('Sword', sprites['Sword'], 'A sharp sword', 
                     damage=15, stun_chance=0.2, bleeding_chance=0.2, critical_hit_chance=0.3, 
                     armor_penetration=0.5, use=equip)
-    sledgehammer = Weapon('Sledgehammer', SLEDGEHAMMER_IMG, 'A really big and heavy sledgehammer', 
+    sledgehammer = Weapon('Sledgehammer', sprites['Sledgehammer'], 'A really big and heavy sledgehammer', 
                     damage=45, stun_chance=0.6, bleeding_chance=0.1, critical_hit_chance=0.3, 
                     armor_penetration=0.2, use=equip)
-    mace = Weapon('Mace', BLANK_SURF, 'A mace', 
+    mace = Weapon('Mace', blank_surf, 'A mace', 
                     damage=30, stun_chance=0.4, bleeding_chance=0.1, critical_hit_chance=0.3, 
                     armor_penetration=0.4, use=equip)
-    knife = Weapon('Knife', KNIFE_IMG, 'A small knife', 
+    knife = Weapon('Knife', sprites['Knife'], 'A small knife', 
                     damage=10, stun_chance=0.1, bleeding_chance=0.2, critical_hit_chance=0.1, 
                     armor_penetration=0.5, use=equip)
-    axe = Weapon('Axe', AXE_IMG, 'An old axe', 
+    axe = Weapon('Axe', sprites['Axe'], 'An old axe', 
                     damage=15, stun_chance=0.2, bleeding_chance=0.4, critical_hit_chance=0.5, 
                     armor_penetration=0.4, use=equip)
     
     # Create entities
-    player = Player(PLAYER_IMG, INV_SLOT_IMG, SELECTED_SLOT_IMG)
     goblin = Enemy('Goblin', health=40, armor=0, dodge_chance=0.5, 
-            pos=[0,0], surf=BLANK_SURF, detection_range=10, weapon=knife)
+            pos=[0,0], surf=blank_surf, detection_range=10, weapon=knife)
     orc = Enemy('Orc', health=60, armor=10, dodge_chance=0.3, 
-            pos=[0,0], surf=BLANK_SURF, detection_range=7, weapon=sword)
+            pos=[0,0], surf=blank_surf, detection_range=7, weapon=sword)
     troll = Enemy('Troll', health=80, armor=40, dodge_chance=0.1, 
-            pos=[0,0], surf=BLANK_SURF, detection_range=5, weapon=sledgehammer)
+            pos=[0,0], surf=blank_surf, detection_range=5, weapon=sledgehammer)
+
+    items = {item.name: item for item in (heal_potion, armor_potion, sword, sledgehammer, mace, knife, axe)}
+    enemies = {enemy.name: enemy for enemy in (goblin, orc, troll)}
+    return items, enemies
+
+def log_combat(bus) -> None:
+    '''Prints dodges and critical hits to the console'''
+    bus.subscribe(Event.ATTACK_DODGED, lambda attacker, target: print(f'{attacker.name}: dodged'))
+    bus.subscribe(Event.CRITICAL_HIT, lambda attacker, target: print(f'{attacker.name}: critical'))
+
+def play_turn(key, player, scheduler, game_field) -> None:
+    '''One full turn: the player's action, effects and enemy AI'''
+    with profiler.phase('input'):
+        handle_input(key, player, game_field)
+    # Apply any existing effects
+    with profiler.phase('effects'):
+        player.apply_effects()
+    # Enemy AI
+    with profiler.phase('enemies'):
+        scheduler.run_turn(player, game_field)
+    player.health = max(0, player.health)
+
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((const.WIDTH, const.HEIGHT))
+    pygame.display.set_caption("GAME!")
     
+    # Load assets
+    BLANK_SURF = pygame.Surface((const.TILE_SIZE, const.TILE_SIZE))
+    BLANK_SURF.fill(const.BLACK)
+    sprites = Atlas(SPRITES).sprites()
     
-    items_1 = {axe: (4,4), copy(heal_potion): (10, 20), copy(heal_potion): (6, 17), copy(armor_potion): (13, 8), sword: (12, 15), 
-               copy(heal_potion): (16, 19), copy(sledgehammer): (14, 22), copy(armor_potion): (15, 23)}
-    walls_1 = [(9,7,Direction.NORTH,7), (10,5,Direction.EAST,9), (5,15,Direction.SOUTH,11), (3,18,Direction.EAST,9),
-               (17,9,Direction.EAST,15), (14,20,Direction.NORTH,9)]
-    enemies_1 = {copy(troll): (12, 14), copy(orc): (11, 2), copy(goblin): (13, 18)}
-
-    items_2 = {copy(knife): (3, 10)}
-    walls_2 = [(3,3,Direction.SOUTH,9)]
-    enemies_2 = {troll: (9, 1)}
+    FONT = pygame.font.Font(None, 30)
+    # GAME_PROFILE=trace.csv (or .json) profiles from the start and writes the trace on exit, F3 toggles it
+    trace_path = os.environ.get('GAME_PROFILE')
+    profiler.enable(bool(trace_path))
+    overlay_font = pygame.font.SysFont('monospace', 14)
+    overlay_rect = None
+    log_combat(bus)
+    
+    items, enemies = create_prototypes(sprites, BLANK_SURF)
+
+    # Every session is recorded, GAME_SEED=n replays one with the same rolls by hand,
+    # headless.py --replay plays the recording back
+    seed = int(os.environ.get('GAME_SEED') or int.from_bytes(os.urandom(8), 'little'))
+    level = 'level1.toml'
+    # level = 'level2.toml'
+    try:
+        replay = Replay(seed, level)
+    except ReplayError as e:
+        sys.exit(f'GAME_SEED: {e}')
+    entity_rng = random.Random(seed)
+    player = Player(sprites['Player'], sprites['Inventory_slot'], sprites['Selected_slot'], entity_rng)
 
     # Initialize game systems
-    game_field = GameField(FLOOR_IMG)
-    statusbar = Statusbar(screen, FONT, player, game_field, enemies=None)
+    game_field, level_enemies = load_level(LEVELS_DIR / level, sprites['Floor'], sprites['Wall'],
+                                           player, items, enemies, entity_rng)
+    statusbar = Statusbar(screen, FONT, player, game_field)
 
-    # _, enemies = load_level(player, game_field, items=items_1, wall_img=WALL_IMG, 
-    #            walls_pos=walls_1, enemies=enemies_1)
-    _, enemies = load_level(player, game_field, statusbar, items=items_1, wall_img=WALL_IMG, 
-               walls_pos=walls_1, enemies=enemies_1)
+    scheduler = TurnScheduler(level_enemies)
 
     # Initial rendering
+    game_field.follow(player.pos)
     game_field.redraw()
     screen.blit(game_field.display_field(), (0, 0))
     statusbar.update_statusbar()
     pygame.display.update()
     
-    # Main game loop
+    # Main game loop. Keys are queued and every tick plays all of them, then renders once if
+    # anything changed. Renders are capped at MAX_FPS and the loop sleeps while there's no input
+    clock = pygame.time.Clock()
+    commands = deque()
     running = True
     while running:
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if not events:
+            events = [pygame.event.wait()]
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-
-                if player.health <= 0:
-                    statusbar.dead_message()
-                else:
-                    handle_input(event.key, player, enemies, game_field)
-                    # Apply any existing effects
-                    player.apply_effects()
-                    # Enemy AI
-                    for enemy in enemies:
-                        if enemy.health <= 0:
-                            enemy.die(game_field)
-                            enemies.remove(enemy)
-                            del enemy
-                        else:
-                            enemy.act(player, game_field)
-                            enemy.apply_effects()
-
-                player.health = max(0,player.health)
-                
-                # Rendering
-                game_field.redraw()
-                screen.blit(game_field.display_field(), (0, 0))
-                statusbar.update_statusbar()
-                pygame.display.update()
+                    running = False
+                    break
+                commands.append(event.key)
+        if not running or not commands:
+            continue
+
+        dead = False
+        while commands:
+            key = commands.popleft()
+            if key == pygame.K_F3:
+                # Toggling the profiler doesn't cost a turn
+                profiler.enable(not profiler.enabled)
+            elif player.health <= 0:
+                dead = True
+            else:
+                replay.record(key)
+                play_turn(key, player, scheduler, game_field)
+
+        # Rendering, only the tiles and panels changed since the last frame are pushed to the display
+        with profiler.phase('redraw'):
+            game_field.follow(player.pos)
+            rects = game_field.redraw()
+            if overlay_rect is not None:
+                # Uncover what the last overlay was drawn over
+                rects.append(overlay_rect)
+                overlay_rect = None
+            for rect in rects:
+                screen.blit(game_field.display_field(), rect, rect)
+        with profiler.phase('statusbar'):
+            if dead:
+                statusbar.dead_message()
+                rects.append(statusbar.rect)
+            else:
+                rects += statusbar.update_statusbar()
+        if profiler.enabled:
+            overlay_rect = profiler.draw(screen, overlay_font)
+            rects.append(overlay_rect)
+        with profiler.phase('display'):
+            pygame.display.update(rects)
+        profiler.end_frame()
+        clock.tick(const.MAX_FPS)
     
+    if trace_path:
+        profiler.export(trace_path)
+    statusbar.close()
+    REPLAYS_DIR.mkdir(exist_ok=True)
+    replay.save(os.environ.get('GAME_REPLAY') or REPLAYS_DIR / 'last.replay')
     pygame.quit()
     sys.exit()
 
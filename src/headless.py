@@ -0,0 +1,191 @@
+'''Runs the turn logic with no window, sprite files or real key events.
+
+    python headless.py --width 200 --height 200 --enemies 300 --turns 2000
+    python headless.py --width 1000 --height 1000 --enemies 5000 --dungeon
+    python headless.py --width 400 --height 400 --enemies 20000 --workers 8
+    python headless.py --replay ../replays/last.replay --frames 10 250 --out shots
+'''
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import random
+import sys
+import time
+import numpy as np
+import pygame
+from utils.constants import TILE_SIZE
+from entities.entity import Direction
+from entities.player import Player
+from entities.enemy import Enemy, PATHFINDING_MODES
+from systems.gamefield import GameField
+from systems.scheduler import TurnScheduler
+from systems.dungeon import generate_level
+from systems.profiler import profiler
+from systems.replay import Replay
+from systems.shards import ShardedScheduler
+from systems.levels import load_level, LEVELS_DIR
+from systems.assets import Atlas
+from game import SPRITES, create_prototypes, play_turn
+
+MOVE_KEYS = (pygame.K_UP, pygame.K_RIGHT, pygame.K_DOWN, pygame.K_LEFT)
+# Random policy, mostly walking around with the odd pick up / use / drop
+RANDOM_KEYS = MOVE_KEYS * 6 + (pygame.K_p, pygame.K_p, pygame.K_f, pygame.K_g, pygame.K_1, pygame.K_2)
+
+def placeholder_sprites() -> dict:
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE))
+    return {name: surf for name in SPRITES}
+
+class HeadlessGame:
+    '''A random map (or a level file) with enemies and items, stepped one key at a time'''
+    def __init__(self, width: int = 30, height: int = 20, enemies: int = 3, items: int = 8,
+                 wall_density: float = 0.05, seed: int | None = None, dungeon: bool = False,
+                 prototypes: tuple[dict, dict] | None = None, level: str | None = None,
+                 sprites: dict | None = None) -> None:
+        # Map, spawn spots and the random policy, a stream of its own so it doesn't
+        # repeat the combat rolls of entity_rng
+        self.rng = random.Random(int(np.random.SeedSequence(seed).spawn(1)[0].generate_state(1, np.uint64)[0]))
+        sprites = sprites or placeholder_sprites()
+        self.item_types, self.enemy_types = prototypes or create_prototypes(sprites, sprites['Floor'])
+        # Seeded like in game.main(), so level runs match the real game roll for roll
+        self.entity_rng = random.Random(seed)
+        self.player = Player(sprites['Player'], sprites['Inventory_slot'], sprites['Selected_slot'],
+                             self.entity_rng)
+        self.turn = 0
+        if level is not None:
+            self.game_field, level_enemies = load_level(LEVELS_DIR / level, sprites['Floor'], sprites['Wall'],
+                                                        self.player, self.item_types, self.enemy_types,
+                                                        self.entity_rng)
+            self.scheduler = TurnScheduler(level_enemies)
+            return
+        if dungeon:
+            self.game_field, level_enemies = generate_level(
+                width, height, sprites['Floor'], sprites['Wall'], self.player,
+                self.item_types, self.enemy_types, enemies, items, seed=seed, entity_rng=self.entity_rng)
+            self.scheduler = TurnScheduler(level_enemies)
+            return
+        self.game_field = GameField(sprites['Floor'], width, height)
+
+        for _ in range(int(width * height * wall_density / 6)):
+            self.game_field.add_wall(sprites['Wall'], self.rng.randrange(height), self.rng.randrange(width),
+                                     self.rng.choice(list(Direction)), self.rng.randint(2, 10))
+
+        free = np.flatnonzero(self.game_field.collision == 0).tolist()
+        spots = self.rng.sample(free, min(len(free), 1 + enemies + items))
+        self.player.pos = list(divmod(spots[0], width))
+        self.game_field.place_entity(self.player.pos, self.player)
+
+        enemy_types = list(self.enemy_types.values())
+        level_enemies = []
+        for spot in spots[1:enemies + 1]:
+            enemy = self.rng.choice(enemy_types).spawn(divmod(spot, width), self.entity_rng)
+            self.game_field.place_entity(enemy.pos, enemy)
+            level_enemies.append(enemy)
+        self.scheduler = TurnScheduler(level_enemies)
+
+        item_types = list(self.item_types.values())
+        for spot in spots[enemies + 1:]:
+            self.game_field.drop_item(divmod(spot, width), self.rng.choice(item_types).spawn())
+
+    def random_key(self) -> int:
+        return self.rng.choice(RANDOM_KEYS)
+
+    def step(self, key: int) -> bool:
+        '''Plays one turn, False once the player is dead'''
+        if self.player.health <= 0:
+            return False
+        play_turn(key, self.player, self.scheduler, self.game_field)
+        profiler.end_frame()
+        self.turn += 1
+        return self.player.health > 0
+
+    def run(self, turns: int, inputs=None) -> int:
+        '''Plays up to turns turns from inputs (random keys if None), returns turns played'''
+        keys = iter(inputs) if inputs is not None else None
+        played = 0
+        for _ in range(turns):
+            key = next(keys, None) if keys is not None else self.random_key()
+            if key is None or not self.step(key):
+                break
+            played += 1
+        return played
+
+    def render(self) -> list[pygame.Rect]:
+        self.game_field.follow(self.player.pos)
+        return self.game_field.redraw()
+
+def play_replay(path, frames=(), out_dir='.') -> HeadlessGame:
+    '''Re-plays a recorded session as fast as it goes, saving the field after each turn in frames
+    as out_dir/turn_<n>.png (turn 0 is the start). Frames get the real sprites'''
+    replay = Replay.load(path)
+    frames = set(frames)
+    if frames:
+        pygame.display.set_mode((1, 1))
+        sprites = Atlas(SPRITES).sprites()
+        blank = pygame.Surface((TILE_SIZE, TILE_SIZE))  # what main() draws enemies with
+        prototypes = create_prototypes(sprites, blank)
+        os.makedirs(out_dir, exist_ok=True)
+    else:
+        sprites = prototypes = None
+    game = HeadlessGame(seed=replay.seed, level=replay.level, sprites=sprites, prototypes=prototypes)
+
+    def snapshot() -> None:
+        if game.turn in frames:
+            game.game_field.invalidate()
+            game.render()
+            pygame.image.save(game.game_field.display_field(), os.path.join(out_dir, f'turn_{game.turn}.png'))
+
+    snapshot()
+    for key in replay.keys():
+        alive = game.step(key)
+        snapshot()
+        if not alive:
+            break
+    return game
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the game without a display')
+    parser.add_argument('--width', type=int, default=30)
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--enemies', type=int, default=3)
+    parser.add_argument('--items', type=int, default=8)
+    parser.add_argument('--turns', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dungeon', action='store_true', help='rooms and corridors instead of random walls')
+    parser.add_argument('--profile', metavar='PATH', help='per turn phase times and counters to a .csv or .json trace')
+    parser.add_argument('--workers', type=int, default=None, help='decide enemy turns in this many processes')
+    parser.add_argument('--pathfinding', choices=PATHFINDING_MODES, default=Enemy.pathfinding,
+                        help='how enemies chase the player, --workers needs flow')
+    parser.add_argument('--replay', metavar='PATH', help='play back a recorded session instead')
+    parser.add_argument('--frames', type=int, nargs='+', default=[], help='replay turns to save as images')
+    parser.add_argument('--out', default='.', help='directory for --frames images')
+    args = parser.parse_args()
+    if args.workers and args.pathfinding != 'flow':
+        parser.error('--workers only supports --pathfinding flow')
+
+    Enemy.pathfinding = args.pathfinding
+    profiler.enable(bool(args.profile))
+    start = time.perf_counter()
+    if args.replay:
+        game = play_replay(args.replay, args.frames, args.out)
+        played = game.turn
+    else:
+        game = HeadlessGame(args.width, args.height, args.enemies, args.items, seed=args.seed, dungeon=args.dungeon)
+        if args.workers:
+            game.scheduler = ShardedScheduler(game.scheduler.enemies, game.game_field, args.workers,
+                                              seed=game.rng.getrandbits(64))
+        start = time.perf_counter()
+        played = game.run(args.turns)
+        if args.workers:
+            game.scheduler.close()
+            print(f'worker pool used on {game.scheduler.pool_turns} of {game.scheduler.turn} turns')
+    elapsed = time.perf_counter() - start
+    print(f'{played} turns in {elapsed:.3f}s ({played / elapsed:.0f} turns/s), '
+          f'player health {game.player.health}, {len(game.scheduler)} enemies left')
+    if args.profile:
+        profiler.export(args.profile)
+        for name, stats in sorted(profiler.stats().items()):
+            print(f"{name:>12} mean {stats['mean']:8.3f} max {stats['max']:8.3f}")
+
+if __name__ == "__main__":
+    sys.exit(main())
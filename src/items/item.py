@@ -1,9 +1,44 @@
-from typing import Callable, Optional
+from typing import Callable, NamedTuple, Optional
+
+class ItemType(NamedTuple):
+    '''Static data shared by every item of a kind'''
+    name: str
+    icon: object
+    description: str
+    use: Optional[Callable] = None
 
 class Item:
+    # Instances only point at their type, copy() / spawn() share it
+    __slots__ = ('proto',)
+    # Items of the same type share an inventory slot
+    stackable = True
+
     def __init__(self, name: str, icon, description: str, 
                  use: Optional[Callable] = None) -> None:
-        self.name = name
-        self.icon = icon
-        self.description = description
-        self.use = use
\ No newline at end of file
+        self.proto = ItemType(name, icon, description, use)
+
+    @classmethod
+    def of_type(cls, proto) -> 'Item':
+        item = cls.__new__(cls)
+        item.proto = proto
+        return item
+
+    def spawn(self) -> 'Item':
+        '''New item of the same type'''
+        return self.of_type(self.proto)
+
+    @property
+    def name(self) -> str:
+        return self.proto.name
+
+    @property
+    def icon(self):
+        return self.proto.icon
+
+    @property
+    def description(self) -> str:
+        return self.proto.description
+
+    @property
+    def use(self) -> Optional[Callable]:
+        return self.proto.use
@@ -1,13 +1,43 @@
 from items.item import Item
-from typing import Optional, Callable 
+from typing import Optional, Callable, NamedTuple
+
+class WeaponType(NamedTuple):
+    name: str
+    icon: object
+    description: str
+    damage: int
+    stun_chance: float
+    bleeding_chance: float
+    critical_hit_chance: float
+    armor_penetration: float
+    use: Optional[Callable] = None
 
 class Weapon(Item):
+    __slots__ = ()
+    stackable = False
+
     def __init__(self, name: str, icon, description: str, 
                  damage: int, stun_chance: float, bleeding_chance: float, critical_hit_chance: float, 
                  armor_penetration: float, use: Optional[Callable] = None) -> None:
-        super().__init__(name, icon, description, use)
-        self.damage = damage
-        self.stun_chance = stun_chance
-        self.bleeding_chance = bleeding_chance
-        self.critical_hit_chance = critical_hit_chance
-        self.armor_penetration = armor_penetration
+        self.proto = WeaponType(name, icon, description, damage, stun_chance, bleeding_chance,
+                                critical_hit_chance, armor_penetration, use)
+
+    @property
+    def damage(self) -> int:
+        return self.proto.damage
+
+    @property
+    def stun_chance(self) -> float:
+        return self.proto.stun_chance
+
+    @property
+    def bleeding_chance(self) -> float:
+        return self.proto.bleeding_chance
+
+    @property
+    def critical_hit_chance(self) -> float:
+        return self.proto.critical_hit_chance
+
+    @property
+    def armor_penetration(self) -> float:
+        return self.proto.armor_penetration
@@ -0,0 +1,78 @@
+'''Sprite atlas.
+
+All sprites are packed into one surface, built the first time and then kept in
+sprites/.cache as atlas.png plus a json manifest of where each sprite sits.
+The manifest also records size and mtime of every source file, an edited or
+added sprite rebuilds the atlas. Sprites are handed out as subsurfaces of it.
+'''
+import json
+from pathlib import Path
+import pygame
+from utils.functions import SPRITES_DIR
+
+ATLAS_WIDTH = 512  # px, sprites are packed in shelves up to this wide
+
+class Atlas:
+    def __init__(self, names, directory=SPRITES_DIR) -> None:
+        self.directory = Path(directory)
+        self.names = tuple(names)
+        self._cache = self.directory / '.cache'
+        self._sprites = {}
+        self.surface, self.rects = self._load()
+
+    def __getitem__(self, name: str) -> pygame.Surface:
+        sprite = self._sprites.get(name)
+        if sprite is None:
+            sprite = self._sprites[name] = self.surface.subsurface(self.rects[name])
+        return sprite
+
+    def sprites(self) -> dict[str, pygame.Surface]:
+        return {name: self[name] for name in self.names}
+
+    def _stamps(self) -> dict[str, list[int]]:
+        stamps = {}
+        for name in self.names:
+            stat = (self.directory / f'{name}.png').stat()
+            stamps[name] = [stat.st_size, stat.st_mtime_ns]
+        return stamps
+
+    def _load(self) -> tuple[pygame.Surface, dict[str, pygame.Rect]]:
+        stamps = self._stamps()
+        manifest_path, image_path = self._cache / 'atlas.json', self._cache / 'atlas.png'
+        try:
+            manifest = json.loads(manifest_path.read_text())
+            if manifest['sources'] != stamps:
+                raise ValueError('sprites changed')
+            surface = pygame.image.load(image_path)
+            rects = {name: pygame.Rect(rect) for name, rect in manifest['rects'].items()}
+        except (OSError, ValueError, KeyError, pygame.error):
+            surface, rects = self._build()
+            self._cache.mkdir(exist_ok=True)
+            pygame.image.save(surface, image_path)
+            manifest_path.write_text(json.dumps({
+                'sources': stamps,
+                'rects': {name: list(rect) for name, rect in rects.items()},
+            }))
+        # Converting needs a display, headless runs keep the loaded format
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        return surface, rects
+
+    def _build(self) -> tuple[pygame.Surface, dict[str, pygame.Rect]]:
+        images = {name: pygame.image.load(self.directory / f'{name}.png') for name in self.names}
+        rects = {}
+        x = y = shelf = 0
+        for name in sorted(images, key=lambda name: -images[name].get_height()):
+            w, h = images[name].get_size()
+            if x and x + w > ATLAS_WIDTH:
+                x, y, shelf = 0, y + shelf, 0
+            rects[name] = pygame.Rect(x, y, w, h)
+            x += w
+            shelf = max(shelf, h)
+
+        width = max((rect.right for rect in rects.values()), default=1)
+        height = max((rect.bottom for rect in rects.values()), default=1)
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        for name, rect in rects.items():
+            surface.blit(images[name], rect)
+        return surface, rects
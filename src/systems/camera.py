@@ -0,0 +1,21 @@
+class Camera:
+    '''Visible window of the world in tiles, kept centred on whatever it follows'''
+    def __init__(self, view_width: int, view_height: int, world_width: int, world_height: int) -> None:
+        self.view_width = min(view_width, world_width)
+        self.view_height = min(view_height, world_height)
+        self.world_width = world_width
+        self.world_height = world_height
+        self.row = 0
+        self.col = 0
+
+    def follow(self, pos) -> bool:
+        '''Centres the view on pos (clamped to the world), returns True if the view moved'''
+        row = min(max(0, pos[0] - self.view_height // 2), self.world_height - self.view_height)
+        col = min(max(0, pos[1] - self.view_width // 2), self.world_width - self.view_width)
+        moved = (row, col) != (self.row, self.col)
+        self.row, self.col = row, col
+        return moved
+
+    def bounds(self) -> tuple[int, int, int, int]:
+        '''First visible row and col, and the ones right past the view'''
+        return self.row, self.col, self.row + self.view_height, self.col + self.view_width
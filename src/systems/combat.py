@@ -0,0 +1,77 @@
+import numpy as np
+from utils.constants import STUN_TIME, BLEEDING_TIME, BLEEDING_DAMAGE
+
+WEAPON_FIELDS = ('damage', 'critical_hit_chance', 'stun_chance', 'bleeding_chance', 'armor_penetration')
+TARGET_FIELDS = ('health', 'armor', 'dodge_chance', 'stun_time', 'bleeding_time', 'stunned')
+
+def weapon_arrays(weapons) -> dict[str, np.ndarray]:
+    '''Stats of a list of weapons, None (no weapon) never hits'''
+    stats = {field: np.array([getattr(w, field, 0) if w is not None else 0 for w in weapons], dtype=float)
+             for field in WEAPON_FIELDS}
+    stats['armed'] = np.array([w is not None for w in weapons], dtype=bool)
+    return stats
+
+def target_arrays(entities) -> dict[str, np.ndarray]:
+    stats = {field: np.array([getattr(e, field) for e in entities], dtype=float)
+             for field in TARGET_FIELDS if field != 'stunned'}
+    stats['stunned'] = np.array([e.stunned for e in entities], dtype=bool)
+    return stats
+
+def resolve_attacks(weapons: dict, targets: dict, attacker_stunned=None, rng=None) -> dict[str, np.ndarray]:
+    '''Vectorized Entity._attack, row i is an attack with weapons[i] on targets[i].
+    Rows are independent, a target listed twice takes both hits from its starting stats.
+    Returns the updated target stats plus hit/dodged/critical masks'''
+    rng = np.random.default_rng(rng)
+    damage = weapons['damage']
+    n = len(damage)
+    dodge_roll, crit_roll, stun_roll, bleed_roll = rng.random((4, n))
+
+    attacking = weapons.get('armed', np.ones(n, dtype=bool))
+    if attacker_stunned is not None:
+        attacking = attacking & ~np.asarray(attacker_stunned, dtype=bool)
+    dodged = attacking & (dodge_roll < targets['dodge_chance'])
+    hit = attacking & ~dodged
+
+    critical = hit & (crit_roll < weapons['critical_hit_chance'])
+    damage = np.where(critical, damage * 1.5, damage)
+    stunning = hit & (stun_roll < weapons['stun_chance'])
+    bleedy = hit & (bleed_roll < weapons['bleeding_chance'])
+
+    armor = targets['armor']
+    penetration = weapons['armor_penetration']
+    armored = armor > penetration
+    new_armor = np.where(hit & armored, np.maximum(0, armor - damage * (1 - penetration)), armor)
+    health_loss = np.where(armored, np.floor_divide(damage * penetration, 3), damage)
+
+    return {
+        'health': targets['health'] - np.where(hit, health_loss, 0),
+        'armor': new_armor,
+        'dodge_chance': targets['dodge_chance'],
+        'stun_time': np.where(stunning, STUN_TIME, targets['stun_time']),
+        'stunned': targets['stunned'] | stunning,
+        'bleeding_time': targets['bleeding_time'] + np.where(bleedy, BLEEDING_TIME, 0),
+        'hit': hit,
+        'dodged': dodged,
+        'critical': critical,
+    }
+
+def tick_effects(targets: dict) -> dict[str, np.ndarray]:
+    '''Vectorized Entity.apply_effects, returns the updated target stats'''
+    bleeding = targets['bleeding_time'] > 0
+    stunned = targets['stun_time'] > 0
+    return {
+        **targets,
+        'health': targets['health'] - np.where(bleeding, BLEEDING_DAMAGE, 0),
+        'bleeding_time': targets['bleeding_time'] - bleeding,
+        'stun_time': targets['stun_time'] - stunned,
+        'stunned': stunned,
+    }
+
+def apply_results(entities, results: dict) -> None:
+    '''Writes resolve_attacks results back onto the target entities'''
+    for i, entity in enumerate(entities):
+        entity.health = results['health'][i].item()
+        entity.armor = results['armor'][i].item()
+        entity.stun_time = int(results['stun_time'][i])
+        entity.stunned = bool(results['stunned'][i])
+        entity.bleeding_time = int(results['bleeding_time'][i])
@@ -0,0 +1,95 @@
+'''Seeded rooms and corridors maps, carved with numpy in bulk.
+
+Rooms are random rectangles (overlaps just merge), chained in a snake order so
+neighbours in the chain are also close on the map, and every room is joined to
+the next one by an L shaped corridor. Rooms and corridors are carved through
+difference arrays and cumulative sums, so there are no per-tile Python loops.
+The chain makes every floor tile reachable from every other one.
+'''
+import numpy as np
+from systems.gamefield import GameField, WALL
+
+ROOM_SIZE = (4, 12)  # min and max room side, in tiles
+ROOM_SPACING = 16    # about one room per ROOM_SPACING x ROOM_SPACING tiles
+
+class DungeonError(Exception):
+    pass
+
+def _carve_rects(shape, r0, c0, r1, c1) -> np.ndarray:
+    '''Union of the half-open rectangles [r0, r1) x [c0, c1)'''
+    h, w = shape
+    diff = np.zeros((h + 1, w + 1), dtype=np.int32)
+    np.add.at(diff, (r0, c0), 1)
+    np.add.at(diff, (r0, c1), -1)
+    np.add.at(diff, (r1, c0), -1)
+    np.add.at(diff, (r1, c1), 1)
+    return diff.cumsum(0).cumsum(1)[:h, :w] > 0
+
+def _snake_order(rows, cols, band: int) -> np.ndarray:
+    bands = rows // band
+    return np.lexsort((np.where(bands % 2, -cols, cols), bands))
+
+def generate_dungeon(width: int, height: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    '''Wall mask (True for wall) and the (n, 2) room centers in chain order'''
+    if width < ROOM_SIZE[0] + 2 or height < ROOM_SIZE[0] + 2:
+        raise DungeonError(f'{width}x{height} is too small for a room')
+    count = max(2, width * height // ROOM_SPACING ** 2)
+    hs = rng.integers(ROOM_SIZE[0], min(ROOM_SIZE[1], height - 2) + 1, count)
+    ws = rng.integers(ROOM_SIZE[0], min(ROOM_SIZE[1], width - 2) + 1, count)
+    # One tile of wall is kept around the map edge
+    r0 = (rng.random(count) * (height - 1 - hs)).astype(np.int64) + 1
+    c0 = (rng.random(count) * (width - 1 - ws)).astype(np.int64) + 1
+    r1, c1 = r0 + hs, c0 + ws
+
+    centers = np.stack(((r0 + r1) // 2, (c0 + c1) // 2), axis=1)
+    centers = centers[_snake_order(centers[:, 0], centers[:, 1], 2 * ROOM_SIZE[1])]
+    (ra, ca), (rb, cb) = centers[:-1].T, centers[1:].T
+
+    # Corridors are one tile wide rectangles: along row ra to column cb, then down column cb to rb
+    floor = _carve_rects((height, width), r0, c0, r1, c1)
+    floor |= _carve_rects((height, width), ra, np.minimum(ca, cb), ra + 1, np.maximum(ca, cb) + 1)
+    floor |= _carve_rects((height, width), np.minimum(ra, rb), cb, np.maximum(ra, rb) + 1, cb + 1)
+    return ~floor, centers
+
+def check_reachable(game_field: GameField, centers) -> None:
+    '''Walks the room chain with the field's own A*, raises DungeonError on a break.
+    Links are short, so this stays cheap even on big maps'''
+    centers = [tuple(center) for center in centers.tolist()]
+    for start, goal in zip(centers, centers[1:]):
+        if game_field.astar_path(start, goal) is None:
+            raise DungeonError(f'room at {goal} is not reachable from {start}')
+
+def generate_level(width: int, height: int, floor_img, wall_img, player, item_types: dict,
+                   enemy_types: dict, enemies: int = 0, items: int = 0, seed=None,
+                   verify: bool = True, entity_rng=None) -> tuple[GameField, list]:
+    '''Same contract as levels.load_level, for a random dungeon of the given size.
+    Enemies and items are spawned from random prototypes on random floor tiles.
+    verify re-checks reachability with A*, about a third of a second at 1000x1000'''
+    rng = np.random.default_rng(seed)
+    walls, centers = generate_dungeon(width, height, rng)
+
+    game_field = GameField(floor_img, width, height)
+    collision = walls.astype(np.uint8) * WALL
+    game_field.set_layers(collision.copy(), collision, [floor_img, wall_img])
+    if verify:
+        check_reachable(game_field, centers)
+
+    free = np.flatnonzero(~walls)
+    if len(free) < 1 + enemies + items:
+        raise DungeonError(f'{len(free)} floor tiles for {1 + enemies + items} things')
+    spots = rng.choice(free, 1 + enemies + items, replace=False)
+    rows, cols = np.divmod(spots, width)
+    places = np.stack((rows, cols), axis=1).tolist()
+
+    player.pos = places[0]
+    game_field.place_entity(player.pos, player)
+
+    enemy_protos, item_protos = list(enemy_types.values()), list(item_types.values())
+    level_enemies = []
+    for pos, kind in zip(places[1:enemies + 1], rng.integers(len(enemy_protos), size=enemies).tolist()):
+        enemy = enemy_protos[kind].spawn(pos, entity_rng)
+        game_field.place_entity(enemy.pos, enemy)
+        level_enemies.append(enemy)
+    for pos, kind in zip(places[enemies + 1:], rng.integers(len(item_protos), size=items).tolist()):
+        game_field.drop_item(tuple(pos), item_protos[kind].spawn())
+    return game_field, level_enemies
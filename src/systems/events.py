@@ -0,0 +1,42 @@
+from enum import Enum, auto
+
+class Event(Enum):
+    # Entity state, source is the entity
+    HEALTH_CHANGED = auto()
+    ARMOR_CHANGED = auto()
+    POS_CHANGED = auto()       # old, pos
+    EFFECTS_CHANGED = auto()
+    WEAPON_CHANGED = auto()
+    ENTITY_REMOVED = auto()    # pos
+    # Combat, source is the attacker
+    ATTACK_DODGED = auto()     # target
+    CRITICAL_HIT = auto()      # target
+    # Inventory, source is the inventory
+    INVENTORY_CHANGED = auto() # slot
+    SELECTION_CHANGED = auto() # slot
+    # Field, source is the game field
+    TILE_ITEMS_CHANGED = auto() # pos
+
+class EventBus:
+    '''Handlers are called as handler(source, **data) right when the event is emitted'''
+    def __init__(self) -> None:
+        self._handlers = {}
+
+    def subscribe(self, event: Event, handler) -> None:
+        self._handlers.setdefault(event, []).append(handler)
+
+    def unsubscribe(self, event: Event, handler) -> None:
+        handlers = self._handlers.get(event)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+            if not handlers:
+                del self._handlers[event]
+
+    def emit(self, event: Event, source, **data) -> None:
+        handlers = self._handlers.get(event)
+        if handlers:
+            for handler in handlers:
+                handler(source, **data)
+
+# Shared by the whole game
+bus = EventBus()
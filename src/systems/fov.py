@@ -0,0 +1,47 @@
+# Symmetric shadowcasting, see https://www.albertford.com/shadowcasting/
+# Slopes are kept as integer fractions (num, den) so no Fraction/float error creeps in
+
+# Maps (depth, col) in a quadrant to a (row, col) offset on the field
+QUADRANTS = (
+    lambda depth, col: (-depth, col),  # north
+    lambda depth, col: (col, depth),   # east
+    lambda depth, col: (depth, col),   # south
+    lambda depth, col: (col, -depth),  # west
+)
+
+def compute_fov(origin, radius: int, is_blocking, height: int, width: int) -> set[tuple[int, int]]:
+    '''Tiles visible from origin up to radius rows away in each quadrant'''
+    orow, ocol = origin[0], origin[1]
+    visible = {(orow, ocol)}
+
+    def blocks(r, c) -> bool:
+        # is_blocking may hand back flag ints, the scan below relies on real bools
+        return not (0 <= r < height and 0 <= c < width) or bool(is_blocking(r, c))
+
+    for transform in QUADRANTS:
+        # Rows to scan: (depth, start slope, end slope)
+        rows = [(1, (-1, 1), (1, 1))]
+        while rows:
+            depth, start, end = rows.pop()
+            if depth > radius:
+                continue
+            # round half up / round half down of depth * slope
+            min_col = (2 * depth * start[0] + start[1]) // (2 * start[1])
+            max_col = -((end[1] - 2 * depth * end[0]) // (2 * end[1]))
+            prev_wall = None
+            for col in range(min_col, max_col + 1):
+                dr, dc = transform(depth, col)
+                r, c = orow + dr, ocol + dc
+                wall = blocks(r, c)
+                symmetric = (col * start[1] >= depth * start[0] and
+                             col * end[1] <= depth * end[0])
+                if (wall or symmetric) and 0 <= r < height and 0 <= c < width:
+                    visible.add((r, c))
+                if prev_wall and not wall:
+                    start = (2 * col - 1, 2 * depth)
+                if prev_wall is False and wall:
+                    rows.append((depth + 1, start, (2 * col - 1, 2 * depth)))
+                prev_wall = wall
+            if prev_wall is False:
+                rows.append((depth + 1, start, end))
+    return visible
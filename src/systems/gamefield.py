@@ -1,51 +1,381 @@
 import pygame
+import numpy as np
 from collections import deque
-from utils.constants import WIDTH, HEIGHT, STATUSBAR_HEIGHT, TILE_SIZE
+from heapq import heappush, heappop
+from utils.constants import (WIDTH, HEIGHT, STATUSBAR_HEIGHT, TILE_SIZE, BLACK,
+                             CHUNK_SIZE, CHUNK_LOAD_MARGIN, FOV_RADIUS)
+from systems.camera import Camera
+from systems.fov import compute_fov
+from systems.spatial import SpatialHash
+from systems.events import bus, Event
+from systems.profiler import profiler
+
+NEIGHBOURS = ((-1, 0), (0, 1), (1, 0), (0, -1))
+
+# Collision grid flags
+WALL = 1
+ENTITY = 2
 
 class Tile:
-    def __init__(self, image, pos, entity=None, items=None, have_collision=False):
-        self.image = image
-        self.pos = pos
-        self.entity = entity
-        self.items = items if items is not None else []
-        self.have_collision = have_collision
+    '''View of a single cell, the data itself lives in the GameField layers'''
+    __slots__ = ('_field', 'pos')
+
+    def __init__(self, field: 'GameField', pos):
+        self._field = field
+        self.pos = (pos[0], pos[1])
+
+    @property
+    def image(self):
+        return self._field._terrain_images[self._field.terrain[self.pos]]
+
+    @property
+    def entity(self):
+        return self._field._entities.get(int(self._field.entity_ids[self.pos]))
+
+    @property
+    def items(self):
+        # Read-only when empty, go through GameField.drop_item to add items
+        return self._field._items.get(self.pos, ())
+
+    @property
+    def have_collision(self) -> bool:
+        return bool(self._field.collision[self.pos])
 
 class GameField:
-    def __init__(self, background_image) -> None:
-        self.width = WIDTH // TILE_SIZE
-        self.height = (HEIGHT - STATUSBAR_HEIGHT) // TILE_SIZE
-        self._tiles = [
-            [Tile(background_image, (r, c)) 
-            for c in range(self.width)]
-            for r in range(self.height)
-        ]
+    def __init__(self, background_image, width: int | None = None, height: int | None = None) -> None:
+        view_width = WIDTH // TILE_SIZE
+        view_height = (HEIGHT - STATUSBAR_HEIGHT) // TILE_SIZE
+        self.width = width or view_width
+        self.height = height or view_height
+        self.camera = Camera(view_width, view_height, self.width, self.height)
+        # Tile layers, a few bytes per tile. Items are sparse, keyed by (r, c)
+        self.terrain = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.collision = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.entity_ids = np.zeros((self.height, self.width), dtype=np.int32)
+        self._terrain_images = [background_image]
+        self._entities = {}
+        self._ids = {}
+        self._next_id = 1
+        self._items = {}
+        # Range queries over placed entities
+        self.spatial = SpatialHash()
+        # The pathfinders read the collision layer through a flat view
+        self._cells = memoryview(self.collision).cast('B')
+
         self.field_surf = pygame.Surface((WIDTH, HEIGHT))
+        # Static terrain is baked per chunk, items and entities are drawn over it.
+        # Only chunks near the camera keep their pixels, far ones are dropped
+        self._chunk_surfs = {}
+        # Tiles changed since the last redraw
+        self._dirty = set()
+        self._full_redraw = True
+        # Bumped whenever walls change, pathfinding caches key on it
+        self.terrain_version = 0
+        self._flow_key = None
+        self._flow_field = None
+        self._flow_radius = 0
+        self._fov_key = None
+        self._fov = set()
 
-    def get_tile(self, pos):
-        r, c = pos
-        return self._tiles[r][c]
+    def get_tile(self, pos) -> Tile:
+        return Tile(self, pos)
 
-    def redraw(self) -> None:
-        self.field_surf.fill((0, 0, 0))
-        for r in range(self.height):
-            for c in range(self.width):
-                tile = self._tiles[r][c]
-                x, y = c * TILE_SIZE, r * TILE_SIZE
-                
-                if tile.entity:
-                    self.field_surf.blit(tile.entity.surf, (x, y))
-                else:
-                    self.field_surf.blit(tile.image, (x, y))
-                    if tile.items:
-                        self.field_surf.blit(tile.items[0].icon, (x, y))
-
-    def add_wall(self, wall_img, row: int, col: int, direction, length: int) -> None:
+    def entity_at(self, pos):
+        return self._entities.get(int(self.entity_ids[pos[0], pos[1]]))
+
+    def is_blocked(self, pos) -> bool:
+        '''True if a wall or an entity is on pos'''
+        return bool(self._cells[pos[0] * self.width + pos[1]])
+
+    def entities_near(self, pos, radius: int) -> list:
+        '''Placed entities within manhattan distance radius of pos, nearest first'''
+        return self.spatial.query_radius(pos, radius)
+
+    def mark_dirty(self, pos) -> None:
+        self._dirty.add((pos[0], pos[1]))
+
+    def invalidate(self) -> None:
+        '''Forces the next redraw to repaint the whole field'''
+        self._full_redraw = True
+
+    def place_entity(self, pos, entity) -> None:
+        entity_id = self._ids.get(entity)
+        if entity_id is None:
+            entity_id = self._next_id
+            self._next_id += 1
+            self._ids[entity] = entity_id
+            self._entities[entity_id] = entity
+        self.entity_ids[pos[0], pos[1]] = entity_id
+        self.collision[pos[0], pos[1]] |= ENTITY
+        self.spatial.move(entity, pos)
+        self.mark_dirty(pos)
+
+    def move_entity(self, entity, new_pos) -> None:
+        '''Moves an already placed entity, updates entity.pos'''
+        r, c = entity.pos
+        self.entity_ids[r, c] = 0
+        self.collision[r, c] &= 0xFF ^ ENTITY
+        self.mark_dirty((r, c))
+        entity.pos = [new_pos[0], new_pos[1]]
+        self.place_entity(new_pos, entity)
+
+    def remove_entity(self, pos) -> None:
+        entity_id = int(self.entity_ids[pos[0], pos[1]])
+        entity = self._entities.pop(entity_id, None)
+        if entity is not None:
+            del self._ids[entity]
+            self.spatial.remove(entity)
+            bus.emit(Event.ENTITY_REMOVED, entity, pos=(pos[0], pos[1]))
+        self.entity_ids[pos[0], pos[1]] = 0
+        self.collision[pos[0], pos[1]] &= 0xFF ^ ENTITY
+        self.mark_dirty(pos)
+
+    def drop_item(self, pos, item) -> None:
+        self._items.setdefault((pos[0], pos[1]), []).append(item)
+        self.mark_dirty(pos)
+        bus.emit(Event.TILE_ITEMS_CHANGED, self, pos=(pos[0], pos[1]))
+
+    def pick_item(self, pos):
+        key = (pos[0], pos[1])
+        items = self._items.get(key)
+        if not items:
+            return None
+        item = items.pop()
+        if not items:
+            del self._items[key]
+        self.mark_dirty(pos)
+        bus.emit(Event.TILE_ITEMS_CHANGED, self, pos=key)
+        return item
+
+    def follow(self, pos) -> None:
+        '''Scrolls the camera to pos, dropping baked chunks that went out of range'''
+        if self.camera.follow(pos):
+            self._full_redraw = True
+            self._drop_far_chunks()
+
+    def _chunks_in_range(self, margin: int) -> set[tuple[int, int]]:
+        r0, c0, r1, c1 = self.camera.bounds()
+        max_cr = (self.height - 1) // CHUNK_SIZE
+        max_cc = (self.width - 1) // CHUNK_SIZE
+        return {
+            (cr, cc)
+            for cr in range(max(0, r0 // CHUNK_SIZE - margin), min(max_cr, (r1 - 1) // CHUNK_SIZE + margin) + 1)
+            for cc in range(max(0, c0 // CHUNK_SIZE - margin), min(max_cc, (c1 - 1) // CHUNK_SIZE + margin) + 1)
+        }
+
+    def _drop_far_chunks(self) -> None:
+        near = self._chunks_in_range(CHUNK_LOAD_MARGIN)
+        # Baked chunks are only pixels, they get re-baked from the terrain layer when needed again
+        for chunk in list(self._chunk_surfs):
+            if chunk not in near:
+                del self._chunk_surfs[chunk]
+
+    def _chunk_surf(self, cr: int, cc: int) -> pygame.Surface:
+        surf = self._chunk_surfs.get((cr, cc))
+        if surf is None:
+            surf = self._bake_chunk(cr, cc)
+            self._chunk_surfs[(cr, cc)] = surf
+        return surf
+
+    def _bake_chunk(self, cr: int, cc: int) -> pygame.Surface:
+        r0, c0 = cr * CHUNK_SIZE, cc * CHUNK_SIZE
+        terrain = self.terrain[r0:r0 + CHUNK_SIZE, c0:c0 + CHUNK_SIZE]
+        surf = pygame.Surface((terrain.shape[1] * TILE_SIZE, terrain.shape[0] * TILE_SIZE))
+        surf.fill(BLACK)
+        for terrain_id, image in enumerate(self._terrain_images):
+            rows, cols = np.nonzero(terrain == terrain_id)
+            surf.blits(
+                [(image, (c * TILE_SIZE, r * TILE_SIZE)) for r, c in zip(rows.tolist(), cols.tolist())],
+                doreturn=False
+            )
+        return surf
+
+    def redraw(self) -> list[pygame.Rect]:
+        '''Repaints changed tiles in view, returns the updated areas of field_surf'''
+        r0, c0, r1, c1 = self.camera.bounds()
+
+        if self._full_redraw:
+            self._full_redraw = False
+            self._dirty.clear()
+            self.field_surf.fill(BLACK)
+            chunks = self._chunks_in_range(0)
+            for cr, cc in chunks:
+                pos = ((cc * CHUNK_SIZE - c0) * TILE_SIZE, (cr * CHUNK_SIZE - r0) * TILE_SIZE)
+                self.field_surf.blit(self._chunk_surf(cr, cc), pos)
+            # Nothing is drawn over the statusbar area
+            self.field_surf.fill(BLACK, (0, (r1 - r0) * TILE_SIZE, WIDTH, HEIGHT))
+
+            overlay = {(r, c) for r, c in self._items if r0 <= r < r1 and c0 <= c < c1}
+            rows, cols = np.nonzero(self.entity_ids[r0:r1, c0:c1])
+            overlay.update(zip((rows + r0).tolist(), (cols + c0).tolist()))
+            drawn = sum(self._draw_overlay(r, c, self._screen_rect(r, c)) for r, c in overlay)
+            profiler.count('blits', len(chunks) + drawn)
+            return [pygame.Rect(0, 0, WIDTH, (r1 - r0) * TILE_SIZE)]
+
+        rects = []
+        drawn = 0
+        for r, c in self._dirty:
+            if not (r0 <= r < r1 and c0 <= c < c1):
+                continue
+            rect = self._screen_rect(r, c)
+            cr, cc = divmod(r, CHUNK_SIZE), divmod(c, CHUNK_SIZE)
+            area = (cc[1] * TILE_SIZE, cr[1] * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            self.field_surf.blit(self._chunk_surf(cr[0], cc[0]), rect, area)
+            drawn += self._draw_overlay(r, c, rect)
+            rects.append(rect)
+        self._dirty.clear()
+        profiler.count('blits', len(rects) + drawn)
+        return rects
+
+    def _screen_rect(self, r: int, c: int) -> pygame.Rect:
+        return pygame.Rect((c - self.camera.col) * TILE_SIZE, (r - self.camera.row) * TILE_SIZE,
+                           TILE_SIZE, TILE_SIZE)
+
+    def _draw_overlay(self, r: int, c: int, rect: pygame.Rect) -> bool:
+        entity = self._entities.get(int(self.entity_ids[r, c]))
+        if entity:
+            self.field_surf.blit(entity.surf, rect)
+        elif (r, c) in self._items:
+            self.field_surf.blit(self._items[(r, c)][0].icon, rect)
+        else:
+            return False
+        return True
+
+    def _terrain_id(self, image) -> int:
+        for terrain_id, known in enumerate(self._terrain_images):
+            if known is image:
+                return terrain_id
+        self._terrain_images.append(image)
+        return len(self._terrain_images) - 1
+
+    def add_wall(self, wall_img, row: int, col: int, direction, length: int) -> list:
+        '''Returns the entities the wall covered, they are taken off the field and
+        have to be dropped from the scheduler too'''
         dr, dc = direction.value
-        for i in range(length):
-            r = row + dr * i
-            c = col + dc * i
-            if 0 <= r < self.height and 0 <= c < self.width:
-                self._tiles[r][c] = Tile(wall_img, (r, c), have_collision=True)
+        rows = row + dr * np.arange(length)
+        cols = col + dc * np.arange(length)
+        inside = (0 <= rows) & (rows < self.height) & (0 <= cols) & (cols < self.width)
+        rows, cols = rows[inside], cols[inside]
+
+        # Entities under the wall are removed for good, not just hidden
+        occupied = np.nonzero(self.entity_ids[rows, cols])[0]
+        removed = []
+        for r, c in zip(rows[occupied].tolist(), cols[occupied].tolist()):
+            removed.append(self.entity_at((r, c)))
+            self.remove_entity((r, c))
+        self.terrain[rows, cols] = self._terrain_id(wall_img)
+        self.collision[rows, cols] = WALL
+        if self._items:
+            for pos in zip(rows.tolist(), cols.tolist()):
+                if self._items.pop(pos, None) is not None:
+                    bus.emit(Event.TILE_ITEMS_CHANGED, self, pos=pos)
+        self._invalidate_terrain(rows, cols)
+        return removed
+
+    def add_wall_spans(self, wall_img, spans) -> None:
+        '''Walls from (row, first col, col past the end) runs, one slice assignment per run.
+        Meant for a fresh field, items and entities under them are left alone'''
+        terrain_id = self._terrain_id(wall_img)
+        for r, start, end in spans:
+            self.terrain[r, start:end] = terrain_id
+            self.collision[r, start:end] = WALL
+        self._chunk_surfs.clear()
+        self._full_redraw = True
+        self.terrain_version += 1
+
+    def set_layers(self, terrain, collision, terrain_images=None) -> None:
+        '''Swaps in whole terrain and collision layers (memory-mapped ones work too).
+        Meant for a fresh field, entities and items are placed afterwards'''
+        self.terrain = terrain
+        self.collision = collision
+        self._cells = memoryview(self.collision).cast('B')
+        if terrain_images is not None:
+            self._terrain_images = list(terrain_images)
+        self._chunk_surfs.clear()
+        self._full_redraw = True
+        self.terrain_version += 1
+
+    def terrain_kinds(self) -> int:
+        return len(self._terrain_images)
+
+    def item_piles(self):
+        '''((r, c), items) for every tile holding items'''
+        return self._items.items()
+
+    def _invalidate_terrain(self, rows, cols) -> None:
+        for chunk in set(zip((rows // CHUNK_SIZE).tolist(), (cols // CHUNK_SIZE).tolist())):
+            self._chunk_surfs.pop(chunk, None)
+        self._full_redraw = True
+        self.terrain_version += 1
+
+    def distance_field(self, goal, radius: int) -> dict[int, int]:
+        '''Steps to goal keyed by flat row-major tile index, for tiles up to radius steps away.
+        Computed once and shared by all chasers until goal or walls change, or a longer radius is asked for'''
+        key = (goal[0], goal[1], self.terrain_version)
+        if self._flow_key is not None and self._flow_key[:3] == key and self._flow_key[3] >= radius:
+            return self._flow_field # type: ignore
+
+        # The longest radius asked for so far, so chasers with different ranges don't take turns refilling it
+        radius = self._flow_radius = max(radius, self._flow_radius)
+        w, h = self.width, self.height
+        cells = self._cells
+        # Sparse, the search never leaves radius so big maps don't pay per tile
+        dist = {goal[0] * w + goal[1]: 0}
+        frontier = [(goal[0], goal[1])]
+        d = 0
+        while frontier and d < radius:
+            d += 1
+            next_frontier = []
+            for r, c in frontier:
+                for dr, dc in NEIGHBOURS:
+                    nr, nc = r + dr, c + dc
+                    if not (0 <= nr < h and 0 <= nc < w):
+                        continue
+                    i = nr * w + nc
+                    # Entities don't block the field, they only block the actual step
+                    if i in dist or cells[i] & WALL:
+                        continue
+                    dist[i] = d
+                    next_frontier.append((nr, nc))
+            frontier = next_frontier
+
+        profiler.count('path_nodes', len(dist))
+        self._flow_key = key + (radius,)
+        self._flow_field = dist
+        return dist
+
+    def visible_tiles(self, origin, radius: int) -> set[tuple[int, int]]:
+        '''Tiles seen from origin, walls block sight. Symmetric, so it also answers
+        who can see origin. Cached until origin or walls change, or a longer radius is asked for'''
+        key = (origin[0], origin[1], self.terrain_version)
+        if self._fov_key is not None and self._fov_key[:3] == key and self._fov_key[3] >= radius:
+            return self._fov
+
+        radius = max(radius, FOV_RADIUS)
+        cells = self._cells
+        w = self.width
+        self._fov = compute_fov(origin, radius, lambda r, c: cells[r * w + c] & WALL, self.height, w)
+        self._fov_key = key + (radius,)
+        return self._fov
+
+    def next_step(self, pos, goal, radius: int):
+        '''Free neighbour of pos closest to goal, None if there is no way to get closer
+        within radius steps'''
+        dist = self.distance_field(goal, radius)
+        w = self.width
+        best, best_dist = None, dist.get(pos[0] * w + pos[1])
+        if best_dist is None:
+            return None
+
+        for dr, dc in NEIGHBOURS:
+            nr, nc = pos[0] + dr, pos[1] + dc
+            if not (0 <= nr < self.height and 0 <= nc < w):
+                continue
+            i = nr * w + nc
+            d = dist.get(i, best_dist)
+            if d < best_dist and not self._cells[i]:
+                best, best_dist = (nr, nc), d
+        return best
 
     def bfs_path(self, start, goal):
         if start == goal:
@@ -60,19 +390,19 @@ class GameField:
             if (r, c) == goal:
                 break
                 
-            for dr, dc in [(-1, 0), (0, 1), (1, 0), (0, -1)]:
+            for dr, dc in NEIGHBOURS:
                 nr, nc = r + dr, c + dc
                 
                 if not (0 <= nr < self.height and 0 <= nc < self.width):
                     continue
                     
-                tile = self._tiles[nr][nc]
-                if (nr, nc) in visited or (tile.have_collision and not tile.entity):
+                if (nr, nc) in visited or self._cells[nr * self.width + nc] & WALL:
                     continue
                     
                 visited[(nr, nc)] = (r, c) # type: ignore
                 queue.append((nr, nc))
                 
+        profiler.count('path_nodes', len(visited))
         if goal not in visited:
             return None
             
@@ -84,5 +414,59 @@ class GameField:
         path.reverse()
         return path
 
+    def astar_path(self, start, goal, max_length=None, max_expansions=None, blocking: int = WALL):
+        '''Same contract as bfs_path, but searches towards the goal over the collision grid.
+        Gives up (None) once the path would exceed max_length or max_expansions nodes were expanded.
+        blocking are the collision flags that can't be walked through, WALL | ENTITY routes around entities'''
+        if start == goal:
+            return []
+
+        w, h = self.width, self.height
+        cells = self._cells
+        gr, gc = goal
+        goal_i = gr * w + gc
+        start_i = start[0] * w + start[1]
+        cost = {start_i: 0}
+        came_from = {start_i: -1}
+        heap = [(abs(start[0] - gr) + abs(start[1] - gc), 0, start_i)]
+        expansions = 0
+
+        while heap:
+            _, g, i = heappop(heap)
+            if i == goal_i:
+                break
+            if g > cost[i]:
+                continue
+            expansions += 1
+            if max_expansions is not None and expansions > max_expansions:
+                profiler.count('path_nodes', expansions)
+                return None
+            if max_length is not None and g >= max_length:
+                continue
+
+            r, c = divmod(i, w)
+            for dr, dc in NEIGHBOURS:
+                nr, nc = r + dr, c + dc
+                if not (0 <= nr < h and 0 <= nc < w):
+                    continue
+                j = nr * w + nc
+                if cells[j] & blocking or cost.get(j, g + 2) <= g + 1:
+                    continue
+                cost[j] = g + 1
+                came_from[j] = i
+                heappush(heap, (g + 1 + abs(nr - gr) + abs(nc - gc), g + 1, j))
+        else:
+            profiler.count('path_nodes', expansions)
+            return None
+        profiler.count('path_nodes', expansions)
+
+        path = []
+        i = goal_i
+        while i != start_i:
+            path.append(divmod(i, w))
+            i = came_from[i]
+        path.reverse()
+        return path
+
     def display_field(self):
-        return self.field_surf
\ No newline at end of file
+        return self.field_surf
@@ -1,23 +1,142 @@
+from heapq import heapify, heappop, heappush
+from systems.events import bus, Event
+from utils.constants import MAX_STACK, INV_PAGE_SIZE
+
 class Inventory:
+    '''Slots 1..capacity, each holding a stack of one item type. slots has one item of every
+    stack (they are all alike), counts the stack sizes'''
     def __init__(self, capacity: int, empty_slot_img, selected_slot_img):
         self.capacity = capacity
         self.slots = {}
+        self.counts = {}
         self.INV_SLOT_IMG = empty_slot_img
         self.SELECTED_SLOT_IMG = selected_slot_img
-        self.selected = 1
+        self._selected = 1
+        # Min-heap, new stacks go to the lowest free slot
+        self._free = list(range(1, capacity + 1))
+        # item type -> slot of a stack of it with room left
+        self._open_stacks = {}
+        # Bumped on every change, slot_versions holds the version each slot last changed at
+        self.version = 0
+        self.slot_versions = {}
+
+    @property
+    def selected(self) -> int:
+        return self._selected
+
+    @selected.setter
+    def selected(self, slot: int) -> None:
+        if slot != self._selected:
+            self._selected = slot
+            bus.emit(Event.SELECTION_CHANGED, self, slot=slot)
+
+    def page_start(self) -> int:
+        '''First slot of the INV_PAGE_SIZE slot page holding the selection'''
+        return (self._selected - 1) // INV_PAGE_SIZE * INV_PAGE_SIZE + 1
+
+    def count(self, slot: int) -> int:
+        return self.counts.get(slot, 0)
+
+    def changed_since(self, version: int) -> list[int]:
+        return [slot for slot, changed in self.slot_versions.items() if changed > version]
+
+    def _changed(self, slot: int) -> None:
+        self.version += 1
+        self.slot_versions[slot] = self.version
+
+    def _add(self, item) -> int | None:
+        slot = self._open_stacks.get(item.proto)
+        if slot is None:
+            if not self._free:
+                return None
+            slot = heappop(self._free)
+            self.slots[slot] = item
+            self.counts[slot] = 0
+        self.counts[slot] += 1
+        if item.stackable and self.counts[slot] < MAX_STACK:
+            self._open_stacks[item.proto] = slot
+        else:
+            self._open_stacks.pop(item.proto, None)
+        self._changed(slot)
+        return slot
+
+    def _remove(self, slot: int, count: int) -> int:
+        item = self.slots.get(slot)
+        if item is None or count <= 0:
+            return 0
+        removed = min(count, self.counts[slot])
+        self.counts[slot] -= removed
+        if self.counts[slot]:
+            if item.stackable:
+                self._open_stacks.setdefault(item.proto, slot)
+        else:
+            del self.slots[slot]
+            del self.counts[slot]
+            if self._open_stacks.get(item.proto) == slot:
+                del self._open_stacks[item.proto]
+            heappush(self._free, slot)
+        self._changed(slot)
+        return removed
 
     def add_item(self, item) -> bool:
-        if len(self.slots) >= self.capacity:
+        slot = self._add(item)
+        if slot is None:
+            return False
+        bus.emit(Event.INVENTORY_CHANGED, self, slot=slot)
+        return True
+
+    def remove_item(self, slot_i: int, count: int = 1) -> bool:
+        '''Takes count items (at most the whole stack) off the stack in slot_i'''
+        if not self._remove(slot_i, count):
             return False
-            
-        for slot in range(1, self.capacity + 1):
-            if slot not in self.slots:
-                self.slots[slot] = item
-                return True
-        return False
-
-    def remove_item(self, slot_i: int) -> bool:
-        if slot_i in self.slots:
-            del self.slots[slot_i]
-            return True
-        return False
\ No newline at end of file
+        bus.emit(Event.INVENTORY_CHANGED, self, slot=slot_i)
+        return True
+
+    def take(self, slot: int):
+        '''Removes one item from the stack in slot and returns it, None if the slot is empty'''
+        item = self.slots.get(slot)
+        if item is None:
+            return None
+        if self.counts[slot] > 1:
+            item = item.spawn()
+        self.remove_item(slot)
+        return item
+
+    def add_items(self, items) -> list:
+        '''Adds as many of items as fit, returns the ones that didn't. One event per changed slot'''
+        changed, left = set(), []
+        for item in items:
+            slot = self._add(item)
+            if slot is None:
+                left.append(item)
+            else:
+                changed.add(slot)
+        for slot in sorted(changed):
+            bus.emit(Event.INVENTORY_CHANGED, self, slot=slot)
+        return left
+
+    def remove_items(self, counts: dict[int, int]) -> int:
+        '''Takes counts[slot] items off every listed slot, returns how many were removed'''
+        removed = 0
+        for slot, count in sorted(counts.items()):
+            taken = self._remove(slot, count)
+            if taken:
+                removed += taken
+                bus.emit(Event.INVENTORY_CHANGED, self, slot=slot)
+        return removed
+
+    def set_stacks(self, stacks: dict[int, tuple]) -> None:
+        '''Replaces the whole content with slot -> (item, count), for loading saves'''
+        for slot in list(self.slots):
+            self._changed(slot)
+        self.slots = {slot: item for slot, (item, _) in stacks.items()}
+        self.counts = {slot: count for slot, (_, count) in stacks.items()}
+        self._free = [slot for slot in range(1, self.capacity + 1) if slot not in self.slots]
+        heapify(self._free)
+        self._open_stacks = {}
+        for slot in sorted(self.slots, reverse=True):
+            item = self.slots[slot]
+            self._changed(slot)
+            if item.stackable and self.counts[slot] < MAX_STACK:
+                self._open_stacks[item.proto] = slot
+        bus.emit(Event.INVENTORY_CHANGED, self, slot=None)
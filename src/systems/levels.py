@@ -0,0 +1,125 @@
+'''Level files.
+
+A level is a TOML file with a character map and a legend for it:
+
+    name = "Level 1"
+    map = """
+    @....#....
+    ..h..#..T.
+    """
+    extra = [{ name = "Heal potion", pos = [1, 2] }]  # optional, for stacking on a tile
+
+    [legend]
+    "h" = "Heal potion"
+    "T" = "Troll"
+
+"." is floor, "#" is wall and "@" is where the player starts, every other character
+is looked up in the legend and names an item or enemy prototype.
+
+Parsed levels are cached in memory and in a .cache directory next to the level,
+keyed by the hash of the file, so only edited levels get parsed again.
+'''
+import hashlib
+import re
+import tomllib
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+from systems.gamefield import GameField
+
+LEVELS_DIR = Path(__file__).resolve().parents[2] / 'levels'
+FLOOR, WALL, PLAYER = '.', '#', '@'
+WALL_RUN = re.compile(re.escape(WALL) + '+')
+THING = re.compile('[^' + re.escape(FLOOR + WALL) + ']')
+
+class LevelError(Exception):
+    pass
+
+class LevelData(NamedTuple):
+    name: str
+    width: int
+    height: int
+    player: tuple[int, int]
+    walls: np.ndarray   # (n, 3) int32 rows of row, first col, col past the end
+    names: np.ndarray   # item / enemy prototype names
+    places: np.ndarray  # (n, 2) int32 positions of those
+
+_parsed = {}
+
+def parse_level(text: str) -> LevelData:
+    data = tomllib.loads(text)
+    legend = data.get('legend', {})
+    lines = data['map'].strip('\n').split('\n')
+    width = max(len(line) for line in lines)
+
+    player = None
+    walls, names, places = [], [], []
+    for r, line in enumerate(lines):
+        for run in WALL_RUN.finditer(line):
+            walls.append((r, run.start(), run.end()))
+        for thing in THING.finditer(line):
+            symbol, c = thing.group(), thing.start()
+            if symbol == PLAYER:
+                player = (r, c)
+            elif symbol in legend:
+                names.append(legend[symbol])
+                places.append((r, c))
+            elif not symbol.isspace():
+                raise LevelError(f'{symbol!r} at {r}, {c} is not in the legend')
+
+    for extra in data.get('extra', []):
+        names.append(extra['name'])
+        places.append(tuple(extra['pos']))
+    if player is None:
+        raise LevelError(f'no {PLAYER!r} in the map')
+
+    return LevelData(
+        data.get('name', ''), width, len(lines), player,
+        np.array(walls, dtype=np.int32).reshape(-1, 3),
+        np.array(names, dtype=str),
+        np.array(places, dtype=np.int32).reshape(-1, 2),
+    )
+
+def read_level(path) -> LevelData:
+    '''Parses a level file, or takes it from the in-memory / on-disk cache'''
+    path = Path(path)
+    raw = path.read_bytes()
+    digest = hashlib.sha1(raw).hexdigest()
+    if digest in _parsed:
+        return _parsed[digest]
+
+    cached = path.parent / '.cache' / f'{digest}.npz'
+    if cached.exists():
+        with np.load(cached) as npz:
+            level = LevelData(str(npz['name']), int(npz['width']), int(npz['height']),
+                              tuple(npz['player'].tolist()), npz['walls'], npz['names'], npz['places'])
+    else:
+        level = parse_level(raw.decode('utf-8'))
+        cached.parent.mkdir(exist_ok=True)
+        np.savez(cached, name=level.name, width=level.width, height=level.height,
+                 player=np.array(level.player), walls=level.walls, names=level.names, places=level.places)
+    _parsed[digest] = level
+    return level
+
+def load_level(path, floor_img, wall_img, player, item_types: dict, enemy_types: dict,
+               entity_rng=None) -> tuple[GameField, list]:
+    '''Builds the field of a level file, places the player and returns the level's enemies.
+    The enemies roll with entity_rng (Entity.default_rng if None)'''
+    level = read_level(path)
+    game_field = GameField(floor_img, level.width, level.height)
+    game_field.add_wall_spans(wall_img, level.walls.tolist())
+
+    player.pos = list(level.player)
+    game_field.place_entity(player.pos, player)
+
+    enemies = []
+    for name, pos in zip(level.names.tolist(), level.places.tolist()):
+        if name in enemy_types:
+            enemy = enemy_types[name].spawn(pos, entity_rng)
+            game_field.place_entity(enemy.pos, enemy)
+            enemies.append(enemy)
+        elif name in item_types:
+            game_field.drop_item(pos, item_types[name].spawn())
+        else:
+            raise LevelError(f'{path}: unknown item or enemy {name!r}')
+    return game_field, enemies
@@ -0,0 +1,99 @@
+import csv
+import json
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter
+import pygame
+
+_OFF = nullcontext()
+
+class _Phase:
+    __slots__ = ('_times', '_name', '_start')
+
+    def __init__(self, times: dict, name: str) -> None:
+        self._times = times
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._start = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self._times[self._name] = self._times.get(self._name, 0.0) + perf_counter() - self._start
+
+class Profiler:
+    '''Per frame phase times and counters. Nested phases are timed inclusively.
+    Disabled, phase() hands back a shared no-op context and count() returns right away'''
+    def __init__(self, window: int = 120) -> None:
+        self.enabled = False
+        self.frame = 0
+        self.trace = []  # one row per finished frame, kept for export
+        self._window = deque(maxlen=window)
+        self._times = {}
+        self._counts = {}
+
+    def enable(self, on: bool = True) -> None:
+        self.enabled = on
+        self._times.clear()
+        self._counts.clear()
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _OFF
+        return _Phase(self._times, name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def end_frame(self) -> None:
+        if not self.enabled:
+            return
+        row = {'frame': self.frame}
+        row.update((f'{name}_ms', 1000 * t) for name, t in self._times.items())
+        row.update(self._counts)
+        self.trace.append(row)
+        self._window.append(row)
+        self.frame += 1
+        self._times = {}
+        self._counts = {}
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        '''Mean and max of every phase and counter over the last window frames'''
+        columns = {}
+        for row in self._window:
+            for name, value in row.items():
+                if name != 'frame':
+                    columns.setdefault(name, []).append(value)
+        frames = len(self._window)
+        # Phases that didn't run in a frame count as 0 there
+        return {name: {'mean': sum(values) / frames, 'max': max(values)} for name, values in columns.items()}
+
+    def export(self, path: str) -> None:
+        '''Writes the trace, JSON for .json paths and CSV otherwise'''
+        if str(path).endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump(self.trace, f)
+            return
+        fields = ['frame'] + sorted({name for row in self.trace for name in row} - {'frame'})
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields, restval=0)
+            writer.writeheader()
+            writer.writerows(self.trace)
+
+    def draw(self, surface: pygame.Surface, font, pos=(4, 4)) -> pygame.Rect:
+        '''Rolling stats as a text box over surface, returns the area it covered'''
+        lines = [f'{name:>12} {s["mean"]:8.2f} {s["max"]:8.2f}' for name, s in sorted(self.stats().items())]
+        images = [font.render(line, True, (255, 255, 255)) for line in ['        mean      max'] + lines]
+        width = max(image.get_width() for image in images) + 8
+        height = sum(image.get_height() for image in images) + 8
+        box = pygame.Surface((width, height))
+        box.set_alpha(200)
+        box.fill((0, 0, 0))
+        surface.blit(box, pos)
+        y = pos[1] + 4
+        for image in images:
+            surface.blit(image, (pos[0] + 4, y))
+            y += image.get_height()
+        return pygame.Rect(pos, (width, height))
+
+profiler = Profiler()
@@ -0,0 +1,65 @@
+'''Replay files: the seed, the level and the key of every turn played.
+
+Keys are stored as one byte each (their index in KEYS) and zlib compressed, keys the
+game doesn't handle still cost a turn and are kept as OTHER.
+'''
+import struct
+import zlib
+import pygame
+
+MAGIC = b'GRPL'
+VERSION = 1
+HEADER = struct.Struct('<4sHQH')  # magic, version, seed, level name length
+
+KEYS = (pygame.K_RIGHT, pygame.K_d, pygame.K_LEFT, pygame.K_a, pygame.K_UP, pygame.K_w, pygame.K_DOWN, pygame.K_s,
+        pygame.K_p, pygame.K_f, pygame.K_g, pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5,
+        pygame.K_6, pygame.K_7, pygame.K_8, pygame.K_9, pygame.K_0, pygame.K_PAGEUP, pygame.K_PAGEDOWN)
+OTHER = 255
+OTHER_KEY = pygame.K_SPACE  # played back for OTHER, handle_input ignores it too
+_INDEX = {key: i for i, key in enumerate(KEYS)}
+
+class ReplayError(Exception):
+    pass
+
+class Replay:
+    def __init__(self, seed: int, level: str) -> None:
+        if not 0 <= seed < 2 ** 64:
+            raise ReplayError(f'seed {seed} does not fit in 64 bits')
+        self.seed = seed
+        self.level = level
+        self._keys = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def record(self, key: int) -> None:
+        self._keys.append(_INDEX.get(key, OTHER))
+
+    def keys(self) -> list[int]:
+        return [KEYS[i] if i != OTHER else OTHER_KEY for i in self._keys]
+
+    def save(self, path) -> None:
+        level = self.level.encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.seed, len(level)))
+            f.write(level)
+            f.write(zlib.compress(bytes(self._keys), 9))
+
+    @classmethod
+    def load(cls, path) -> 'Replay':
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ReplayError(f'{path}: too short for a replay')
+        magic, version, seed, level_len = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ReplayError(f'{path}: not a replay file')
+        if version != VERSION:
+            raise ReplayError(f'{path}: replay version {version}, expected {VERSION}')
+        start = HEADER.size + level_len
+        replay = cls(seed, data[HEADER.size:start].decode('utf-8'))
+        try:
+            replay._keys = bytearray(zlib.decompress(data[start:]))
+        except zlib.error as e:
+            raise ReplayError(f'{path}: corrupt key log') from e
+        return replay
@@ -0,0 +1,179 @@
+'''Binary save files.
+
+    header | terrain layer | wall layer | records
+
+Both layers are raw row-major uint8 arrays, on load they are memory-mapped
+copy-on-write so only the pages that get used are read. Entities, items and
+the inventory go in the records section, names are stored once in a string
+table and referenced by index.
+'''
+import os
+import struct
+import numpy as np
+from systems.gamefield import GameField, WALL
+from systems.scheduler import TurnScheduler
+
+MAGIC = b'GSAV'
+VERSION = 2
+# magic, version, width, height, terrain kinds, layers offset, records offset
+HEADER = struct.Struct('<4sHIIHQQ')
+# health, armor, row, col, stun time, bleeding time, stunned, weapon name index (0 = none)
+ENTITY = struct.Struct('<ddiiHH?H')
+# type name index, extra state: idle wait, turns of effects to catch up on
+ENEMY = struct.Struct('<HHI')
+COUNT = struct.Struct('<I')
+SLOT = struct.Struct('<HH')
+# slot, item name index, stack size
+STACK = struct.Struct('<HHH')
+POS = struct.Struct('<ii')
+INDEX = struct.Struct('<H')
+
+class SaveError(Exception):
+    pass
+
+class _Names:
+    def __init__(self) -> None:
+        self.names = [None]  # 0 means "nothing"
+        self._index = {}
+
+    def __call__(self, name) -> int:
+        if name is None:
+            return 0
+        if name not in self._index:
+            self._index[name] = len(self.names)
+            self.names.append(name)
+        return self._index[name]
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.offset = 0
+
+    def read(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def read_str(self) -> str:
+        (length,) = self.read(INDEX)
+        text = self.data[self.offset:self.offset + length].decode('utf-8')
+        self.offset += length
+        return text
+
+def _entity_record(entity, name) -> bytes:
+    weapon = entity.weapon.name if entity.weapon is not None else None
+    return ENTITY.pack(entity.health, entity.armor, entity.pos[0], entity.pos[1],
+                       entity.stun_time, entity.bleeding_time, entity.stunned, name(weapon))
+
+def _records(game_field, player, scheduler) -> bytes:
+    name = _Names()
+    body = [_entity_record(player, name)]
+
+    inv = player.inventory
+    body.append(SLOT.pack(inv.selected, len(inv.slots)))
+    for slot, item in sorted(inv.slots.items()):
+        body.append(STACK.pack(slot, name(item.name), inv.count(slot)))
+
+    enemies = scheduler.enemies
+    body.append(COUNT.pack(len(enemies)))
+    for enemy in enemies:
+        body.append(_entity_record(enemy, name))
+        body.append(ENEMY.pack(name(enemy.name), enemy._idle_state_wait_time, scheduler.lag(enemy)))
+
+    piles = list(game_field.item_piles())
+    body.append(COUNT.pack(len(piles)))
+    for (r, c), items in piles:
+        body.append(POS.pack(r, c))
+        body.append(COUNT.pack(len(items)))
+        body.extend(INDEX.pack(name(item.name)) for item in items)
+
+    table = [INDEX.pack(len(name.names) - 1)]
+    for text in name.names[1:]:
+        encoded = text.encode('utf-8')
+        table.append(INDEX.pack(len(encoded)) + encoded)
+    return b''.join(table + body)
+
+def save_game(path, game_field: GameField, player, scheduler: TurnScheduler) -> None:
+    h, w = game_field.height, game_field.width
+    layers_offset = HEADER.size
+    records_offset = layers_offset + 2 * h * w
+    # Written next to the target and swapped in, a field loaded from path may still be mapping it
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, w, h, game_field.terrain_kinds(), layers_offset, records_offset))
+        f.write(memoryview(np.ascontiguousarray(game_field.terrain)).cast('B'))
+        # Entity flags are rebuilt when entities are placed again
+        f.write(memoryview(np.ascontiguousarray(game_field.collision & WALL)).cast('B'))
+        f.write(_records(game_field, player, scheduler))
+    os.replace(tmp_path, path)
+
+def _number(value: float):
+    return int(value) if value.is_integer() else value
+
+def _restore_entity(entity, record, items: dict) -> None:
+    health, armor, r, c, stun_time, bleeding_time, stunned, weapon = record
+    entity.health = _number(health)
+    entity.armor = _number(armor)
+    entity.pos = [r, c]
+    entity.stun_time = stun_time
+    entity.bleeding_time = bleeding_time
+    entity.stunned = stunned
+    entity.weapon = items[weapon].spawn() if weapon is not None else None
+
+def load_game(path, terrain_images, player, item_types: dict, enemy_types: dict,
+              entity_rng=None) -> tuple[GameField, TurnScheduler]:
+    '''terrain_images must list the images by terrain id (floor first, then walls in the order
+    they were first used), item/enemy types are the prototypes by name. The player object is
+    updated in place, enemies roll with entity_rng'''
+    with open(path, 'rb') as f:
+        magic, version, w, h, kinds, layers_offset, records_offset = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise SaveError(f'{path} is not a version {VERSION} save file')
+        if kinds > len(terrain_images):
+            raise SaveError(f'{path} uses {kinds} terrain kinds, only {len(terrain_images)} images given')
+        f.seek(records_offset)
+        reader = _Reader(f.read())
+
+    game_field = GameField(terrain_images[0], w, h)
+    terrain = np.memmap(path, dtype=np.uint8, mode='c', offset=layers_offset, shape=(h, w))
+    collision = np.memmap(path, dtype=np.uint8, mode='c', offset=layers_offset + h * w, shape=(h, w))
+    game_field.set_layers(terrain, collision, terrain_images)
+
+    (count,) = reader.read(INDEX)
+    names = [None] + [reader.read_str() for _ in range(count)]
+    named_items = {name: item_types[name] for name in names[1:] if name in item_types}
+
+    def named(record):
+        return record[:-1] + (names[record[-1]],)
+
+    _restore_entity(player, named(reader.read(ENTITY)), named_items)
+    game_field.place_entity(player.pos, player)
+    selected, slots = reader.read(SLOT)
+    stacks = {}
+    for _ in range(slots):
+        slot, item, count = reader.read(STACK)
+        stacks[slot] = (item_types[names[item]].spawn(), count)
+    player.inventory.set_stacks(stacks)
+    player.inventory.selected = selected
+
+    enemies, lags = [], []
+    (count,) = reader.read(COUNT)
+    for _ in range(count):
+        record = named(reader.read(ENTITY))
+        kind, idle_wait, lag = reader.read(ENEMY)
+        enemy = enemy_types[names[kind]].spawn(record[2:4], entity_rng)
+        _restore_entity(enemy, record, named_items)
+        enemy._idle_state_wait_time = idle_wait
+        game_field.place_entity(enemy.pos, enemy)
+        enemies.append(enemy)
+        lags.append(lag)
+
+    (count,) = reader.read(COUNT)
+    for _ in range(count):
+        pos = reader.read(POS)
+        (n,) = reader.read(COUNT)
+        for _ in range(n):
+            (item,) = reader.read(INDEX)
+            game_field.drop_item(pos, item_types[names[item]].spawn())
+
+    return game_field, TurnScheduler(enemies, lags)
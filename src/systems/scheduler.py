@@ -0,0 +1,60 @@
+from utils.constants import AI_WAKE_RANGE
+from utils.functions import manhattan_distance
+from systems.profiler import profiler
+
+class TurnScheduler:
+    '''Runs enemy turns by distance to the player. Enemies that can see the player get the
+    full AI, the ones around them only wander, the rest stay frozen and catch up on wake'''
+    def __init__(self, enemies, lags=None) -> None:
+        self.turn = 0
+        # enemy -> last turn it was updated, lags are turns an enemy already missed
+        lags = lags or [0] * len(enemies)
+        self._last_turn = {enemy: -lag for enemy, lag in zip(enemies, lags)}
+        self.wake_range = max([AI_WAKE_RANGE] + [enemy.detection_range for enemy in enemies])
+
+    @property
+    def enemies(self) -> list:
+        '''Copy of every scheduled enemy, O(enemies), keep it out of per-turn code'''
+        return list(self._last_turn)
+
+    def __len__(self) -> int:
+        return len(self._last_turn)
+
+    def remove(self, enemy) -> None:
+        '''Stops scheduling an enemy taken off the field some other way than dying'''
+        self._last_turn.pop(enemy, None)
+
+    def lag(self, enemy) -> int:
+        '''Turns of effects the enemy still has to catch up on'''
+        return self.turn - self._last_turn[enemy]
+
+    def _wake(self, player, game_field, dead: list):
+        '''Yields the enemies in wake range of the player nearest first, caught up on the effects
+        of the turns they were frozen for. Ones that turn out dead are removed and go to dead'''
+        for enemy in game_field.entities_near(player.pos, self.wake_range):
+            last_turn = self._last_turn.get(enemy)
+            if last_turn is None:  # the player or anything else we don't schedule
+                continue
+            self._last_turn[enemy] = self.turn
+            if self.turn - last_turn > 1:
+                enemy.catch_up_effects(self.turn - last_turn - 1)
+
+            if enemy.health <= 0:
+                enemy.die(game_field)
+                del self._last_turn[enemy]
+                dead.append(enemy)
+            else:
+                yield enemy
+
+    def run_turn(self, player, game_field) -> list:
+        '''Updates the awake enemies, returns the ones that died'''
+        self.turn += 1
+        dead = []
+        for enemy in self._wake(player, game_field, dead):
+            if manhattan_distance(enemy.pos, player.pos) <= enemy.detection_range:
+                with profiler.phase('act'):
+                    enemy.act(player, game_field)
+            else:
+                enemy.idle(game_field)
+            enemy.apply_effects()
+        return dead
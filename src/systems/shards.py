@@ -0,0 +1,184 @@
+'''Enemy turns decided in worker processes, for worlds with a lot of awake enemies.
+
+The collision layer is moved into shared memory, so workers see every wall and
+entity flag without copying. Each turn the awake enemies are grouped by spatial
+shard and written to a shared array; every worker decides attack / move / wander for
+a run of shards against the start of turn state and writes the result back. The main
+process then applies the results nearest first, like TurnScheduler, so when two
+enemies go for the same tile (across a shard border or not) the nearer one gets it
+and the other stays. Decisions only read the snapshot, and wandering rolls are a hash
+of (seed, turn, enemy) instead of a draw from a shared stream, which makes the outcome
+the same for any number of workers or shards.
+
+Only 'flow' pathfinding is supported, per-enemy paths live in the main process.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import numpy as np
+from entities.entity import Direction
+from systems.gamefield import GameField
+from systems.scheduler import TurnScheduler
+from systems.profiler import profiler
+from utils.constants import SHARD_SIZE, SHARD_MIN_ENEMIES, FLOW_DETOUR_MARGIN
+
+# Decisions, first column of the results array
+STAY, MOVE, ATTACK = range(3)
+
+# Entity rows: row, col, detection range, idle wait, index. Result rows: decision, row, col, idle wait
+ENTITY_COLUMNS, RESULT_COLUMNS = 5, 4
+
+DIRECTIONS = [d.value for d in Direction]
+MASK = (1 << 64) - 1
+
+def _roll(seed: int, turn: int, index: int) -> int:
+    '''splitmix64 of (seed, turn, index), the same 64 bits whichever process asks'''
+    x = (seed + turn * 0x9E3779B97F4A7C15 + index * 0xD1B54A32D192ED03) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+def decide(game_field: GameField, entities, results, start: int, end: int, target, seed: int, turn: int) -> None:
+    '''Enemy.act / Enemy.idle for rows start:end of entities, into results'''
+    tr, tc = target
+    for i in range(start, end):
+        r, c, detection_range, wait, index = entities[i].tolist()
+        dist = abs(r - tr) + abs(c - tc)
+        if dist <= detection_range and (r, c) in game_field.visible_tiles(target, detection_range):
+            if dist == 1:
+                results[i] = (ATTACK, r, c, wait)
+            else:
+                step = game_field.next_step((r, c), target, detection_range + FLOW_DETOUR_MARGIN)
+                results[i] = (STAY, r, c, wait) if step is None else (MOVE, *step, wait)
+        elif wait:
+            results[i] = (STAY, r, c, wait - 1)
+        else:
+            roll = _roll(seed, turn, index)
+            dr, dc = DIRECTIONS[roll % len(DIRECTIONS)]
+            nr, nc = r + dr, c + dc
+            wait = 1 + (roll >> 8) % 3
+            if 0 <= nr < game_field.height and 0 <= nc < game_field.width and not game_field.is_blocked((nr, nc)):
+                results[i] = (MOVE, nr, nc, wait)
+            else:
+                results[i] = (STAY, r, c, wait)
+
+# Worker process side, set up once by _attach
+_worker = {}
+
+def _attach(names: tuple[str, str, str], shape: tuple[int, int], capacity: int) -> None:
+    blocks = [shared_memory.SharedMemory(name) for name in names]
+    collision = np.ndarray(shape, dtype=np.uint8, buffer=blocks[0].buf)
+    game_field = GameField(None, shape[1], shape[0])
+    game_field.set_layers(np.zeros(shape, dtype=np.uint8), collision)
+    _worker.update(
+        blocks=blocks,
+        game_field=game_field,
+        entities=np.ndarray((capacity, ENTITY_COLUMNS), dtype=np.int32, buffer=blocks[1].buf),
+        results=np.ndarray((capacity, RESULT_COLUMNS), dtype=np.int32, buffer=blocks[2].buf),
+    )
+
+def _decide_run(start: int, end: int, target, seed: int, turn: int, terrain_version: int) -> None:
+    game_field = _worker['game_field']
+    # Walls are already in shared memory, this only drops sight and flow caches
+    game_field.terrain_version = terrain_version
+    decide(game_field, _worker['entities'], _worker['results'], start, end, target, seed, turn)
+
+class ShardedScheduler(TurnScheduler):
+    '''TurnScheduler with the awake enemies decided in worker processes.
+    Moves game_field's collision layer into shared memory, close() moves it back.
+    Wandering is rolled from seed, not from each enemy's rng'''
+    def __init__(self, enemies, game_field: GameField, workers: int | None = None, lags=None, seed: int = 0) -> None:
+        super().__init__(enemies, lags)
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed & MASK
+        self.pool_turns = 0
+        # Stable per-enemy index for the wandering rolls, whatever row an enemy lands in
+        self._index = {enemy: i for i, enemy in enumerate(enemies)}
+        shape = game_field.collision.shape
+        capacity = max(1, len(enemies))
+        self._blocks = [
+            shared_memory.SharedMemory(create=True, size=game_field.collision.nbytes),
+            shared_memory.SharedMemory(create=True, size=capacity * ENTITY_COLUMNS * 4),
+            shared_memory.SharedMemory(create=True, size=capacity * RESULT_COLUMNS * 4),
+        ]
+        collision = np.ndarray(shape, dtype=np.uint8, buffer=self._blocks[0].buf)
+        collision[:] = game_field.collision
+        game_field.set_layers(game_field.terrain, collision)
+        self._game_field = game_field
+        self._entities = np.ndarray((capacity, ENTITY_COLUMNS), dtype=np.int32, buffer=self._blocks[1].buf)
+        self._results = np.ndarray((capacity, RESULT_COLUMNS), dtype=np.int32, buffer=self._blocks[2].buf)
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_attach,
+                                         initargs=(tuple(b.name for b in self._blocks), shape, capacity))
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        # The field outlives the shared memory, give it a private copy of the layer
+        game_field = self._game_field
+        game_field.set_layers(game_field.terrain, game_field.collision.copy())
+        self._entities = self._results = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> 'ShardedScheduler':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _runs(self, shards: np.ndarray) -> list[tuple[int, int]]:
+        '''Rows of the shard sorted entity array cut into about 4 runs per worker, on shard borders'''
+        borders = np.flatnonzero(np.diff(shards)) + 1
+        n = len(shards)
+        cuts = [0]
+        for cut in np.linspace(0, n, min(n, 4 * self.workers) + 1)[1:-1]:
+            # Move each cut to the next shard border so a shard is never split
+            i = np.searchsorted(borders, cut)
+            if i < len(borders) and borders[i] > cuts[-1]:
+                cuts.append(int(borders[i]))
+        cuts.append(n)
+        return list(zip(cuts, cuts[1:]))
+
+    def _decide(self, awake: list, player, game_field: GameField) -> None:
+        n = len(awake)
+        entities = self._entities[:n]
+        entities[:] = [(e.pos[0], e.pos[1], e.detection_range, e.idle_wait, self._index[e]) for e in awake]
+        target = (player.pos[0], player.pos[1])
+        if n < SHARD_MIN_ENEMIES:
+            decide(game_field, entities, self._results, 0, n, target, self.seed, self.turn)
+            return
+
+        # Rows are grouped by shard so every run of rows is a handful of whole shards
+        shards = (entities[:, 0] // SHARD_SIZE) * (game_field.width // SHARD_SIZE + 1) + entities[:, 1] // SHARD_SIZE
+        order = np.argsort(shards, kind='stable')
+        entities[:] = entities[order]
+        runs = self._runs(shards[order])
+        futures = [self._pool.submit(_decide_run, start, end, target, self.seed, self.turn, game_field.terrain_version)
+                   for start, end in runs]
+        for future in futures:
+            future.result()
+        self.pool_turns += 1
+        profiler.count('shard_runs', len(runs))
+        # Back to the order of awake
+        results = np.empty_like(self._results[:n])
+        results[order] = self._results[:n]
+        self._results[:n] = results
+
+    def run_turn(self, player, game_field) -> list:
+        self.turn += 1
+        dead = []
+        awake = list(self._wake(player, game_field, dead))
+        with profiler.phase('act'):
+            self._decide(awake, player, game_field)
+
+        for enemy, (action, r, c, wait) in zip(awake, self._results[:len(awake)].tolist()):
+            if action == ATTACK:
+                enemy._attack(player)
+            elif action == MOVE:
+                # Taken already by someone nearer to the player this turn, wait
+                if not game_field.is_blocked((r, c)):
+                    enemy.set_pos((r, c), game_field)
+            enemy.idle_wait = wait
+            enemy.apply_effects()
+        return dead
@@ -0,0 +1,63 @@
+from utils.constants import SPATIAL_CELL_SIZE
+
+class SpatialHash:
+    '''Uniform grid of buckets so range queries only touch nearby entities'''
+    def __init__(self, cell_size: int = SPATIAL_CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self._buckets = {}
+        self._where = {}
+        self._pos = {}
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, entity) -> bool:
+        return entity in self._where
+
+    def move(self, entity, pos) -> None:
+        '''Inserts entity at pos, or moves it there if it is already indexed'''
+        cell = (pos[0] // self.cell_size, pos[1] // self.cell_size)
+        self._pos[entity] = (pos[0], pos[1])
+        old = self._where.get(entity)
+        if old == cell:
+            return
+        if old is not None:
+            self._discard(entity, old)
+        self._where[entity] = cell
+        self._buckets.setdefault(cell, set()).add(entity)
+
+    def remove(self, entity) -> None:
+        cell = self._where.pop(entity, None)
+        if cell is not None:
+            del self._pos[entity]
+            self._discard(entity, cell)
+
+    def _discard(self, entity, cell) -> None:
+        bucket = self._buckets[cell]
+        bucket.discard(entity)
+        if not bucket:
+            del self._buckets[cell]
+
+    def query_rect(self, r0: int, c0: int, r1: int, c1: int) -> list:
+        '''Entities with r0 <= row < r1 and c0 <= col < c1'''
+        size = self.cell_size
+        found = []
+        for cr in range(r0 // size, (r1 - 1) // size + 1):
+            for cc in range(c0 // size, (c1 - 1) // size + 1):
+                for entity in self._buckets.get((cr, cc), ()):
+                    r, c = self._pos[entity]
+                    if r0 <= r < r1 and c0 <= c < c1:
+                        found.append(entity)
+        return found
+
+    def query_radius(self, pos, radius: int) -> list:
+        '''Entities within manhattan distance radius of pos, nearest first'''
+        pr, pc = pos[0], pos[1]
+        found = []
+        for entity in self.query_rect(pr - radius, pc - radius, pr + radius + 1, pc + radius + 1):
+            r, c = self._pos[entity]
+            dist = abs(r - pr) + abs(c - pc)
+            if dist <= radius:
+                found.append((dist, r, c, entity))
+        found.sort(key=lambda e: e[:3])
+        return [entity for *_, entity in found]
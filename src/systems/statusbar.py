@@ -1,77 +1,201 @@
 import pygame
-from utils.constants import WIDTH, HEIGHT, STATUSBAR_HEIGHT, TILE_SIZE, LINE_OFFSET, WHITE, BLACK
+from functools import lru_cache
+from utils.constants import (WIDTH, HEIGHT, STATUSBAR_HEIGHT, TILE_SIZE, LINE_OFFSET, WHITE, BLACK, TEXT_CACHE_SIZE,
+                             INV_PAGE_SIZE)
+from utils.functions import manhattan_distance
+from systems.events import bus, Event
 
 class Statusbar:
-    def __init__(self, screen, font, player, game_field, enemies):
+    def __init__(self, screen, font, player, game_field):
         self.screen = screen
         self.font = font
         self.player = player
         self.game_field = game_field
-        self.enemies = enemies
         self.statusbar = pygame.Surface((WIDTH, STATUSBAR_HEIGHT))
         self.PANEL_SECTION_OFFSET = WIDTH // 5
+        self.rect = pygame.Rect(0, HEIGHT - STATUSBAR_HEIGHT, WIDTH, STATUSBAR_HEIGHT)
+        # Panels are kept between frames and only redrawn when what they show changes
+        self._left_panel = pygame.Surface((self.PANEL_SECTION_OFFSET, STATUSBAR_HEIGHT))
+        self._middle_panel = None
+        self._right_panel = pygame.Surface((self.PANEL_SECTION_OFFSET * 3, STATUSBAR_HEIGHT))
+        self._shown = {}
+        self._render_text = lru_cache(maxsize=TEXT_CACHE_SIZE)(self._render_text_uncached)
+        # Panels that may show something else, filled in by game events
+        self._stale = {'left', 'middle', 'right'}
+        # Dropped again by close()
+        self._handlers = (
+            (Event.HEALTH_CHANGED, self._on_player_stats),
+            (Event.ARMOR_CHANGED, self._on_player_stats),
+            (Event.POS_CHANGED, self._on_pos_changed),
+            (Event.EFFECTS_CHANGED, self._on_player_status),
+            (Event.WEAPON_CHANGED, self._on_player_status),
+            (Event.ENTITY_REMOVED, self._on_entity_removed),
+            (Event.TILE_ITEMS_CHANGED, self._on_tile_items),
+            (Event.INVENTORY_CHANGED, self._on_inventory),
+            (Event.SELECTION_CHANGED, self._on_inventory),
+        )
+        for event, handler in self._handlers:
+            bus.subscribe(event, handler)
 
-    def update_statusbar(self) -> None:
-        self.statusbar.fill(BLACK)
-        self._update_left_panel()
-        self._update_middle_panel()
-        self._update_right_panel()
-        self.screen.blit(self.statusbar, (0, HEIGHT - STATUSBAR_HEIGHT))
+    def close(self) -> None:
+        '''Unsubscribes from the bus, the statusbar stops tracking changes'''
+        for event, handler in self._handlers:
+            bus.unsubscribe(event, handler)
+        self._handlers = ()
+
+    def __enter__(self) -> 'Statusbar':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _on_player_stats(self, source, **_) -> None:
+        if source is self.player:
+            self._stale.add('left')
+
+    def _on_player_status(self, source, **_) -> None:
+        if source is self.player:
+            self._stale.add('right')
+
+    def _near_player(self, pos) -> bool:
+        return pos is not None and manhattan_distance(pos, self.player.pos) <= self.player.detection_range
+
+    def _on_pos_changed(self, source, old, pos) -> None:
+        if source is self.player:
+            self._stale.update(('left', 'right'))
+        elif self._near_player(old) or self._near_player(pos):
+            self._stale.add('right')
+
+    def _on_entity_removed(self, source, pos) -> None:
+        if self._near_player(pos):
+            self._stale.add('right')
+
+    def _on_tile_items(self, source, pos) -> None:
+        if pos[0] == self.player.pos[0] and pos[1] == self.player.pos[1]:
+            self._stale.add('right')
+
+    def _on_inventory(self, source, **_) -> None:
+        if source is self.player.inventory:
+            self._stale.add('middle')
+
+    def _render_text_uncached(self, text: str, colour) -> pygame.Surface:
+        return self.font.render(text, False, colour)
 
-    def _update_left_panel(self) -> None:
+    def update_statusbar(self) -> list[pygame.Rect]:
+        '''Redraws the panels whose content changed, returns the updated screen areas'''
+        rects = []
+        for name, update in (('left', self._update_left_panel), ('middle', self._update_middle_panel),
+                             ('right', self._update_right_panel)):
+            if name in self._stale:
+                rect = update()
+                if rect is not None:
+                    rects.append(rect)
+        self._stale.clear()
+        return rects
+
+    def _show(self, name: str, state, panel_surf, pos) -> pygame.Rect:
+        self._shown[name] = state
+        self.statusbar.blit(panel_surf, pos)
+        self.screen.blit(panel_surf, (pos[0], pos[1] + self.rect.y))
+        return pygame.Rect(pos[0], pos[1] + self.rect.y, *panel_surf.get_size())
+
+    def _update_left_panel(self) -> pygame.Rect | None:
         player_info = self.player.get_info()
-        for i, (feature, value) in enumerate(player_info.items()):
-            text = f'{feature}: {value}'
-            feature_surf = self.font.render(text, False, WHITE)
-            self.statusbar.blit(feature_surf, (0, i * LINE_OFFSET))
+        lines = tuple(f'{feature}: {value}' for feature, value in player_info.items())
+        if self._shown.get('left') == lines:
+            return None
+
+        self._left_panel.fill(BLACK)
+        for i, text in enumerate(lines):
+            self._left_panel.blit(self._render_text(text, WHITE), (0, i * LINE_OFFSET))
+        return self._show('left', lines, self._left_panel, (0, 0))
 
-    def _update_middle_panel(self) -> None:
+    def _draw_slot(self, inv, slot: int, first: int) -> pygame.Rect:
+        icons_in_line = (min(inv.capacity, INV_PAGE_SIZE) + 1) // 2
+        i = slot - first
+        rect = pygame.Rect(TILE_SIZE * (i % icons_in_line), TILE_SIZE * (i // icons_in_line), TILE_SIZE, TILE_SIZE)
+        panel_surf = self._middle_panel
+        panel_surf.fill(BLACK, rect)
+        panel_surf.blit(inv.SELECTED_SLOT_IMG if inv.selected == slot else inv.INV_SLOT_IMG, rect)
+        item = inv.slots.get(slot)
+        if item:
+            panel_surf.blit(item.icon, rect)
+            if inv.count(slot) > 1:
+                text = self._render_text(str(inv.count(slot)), WHITE)
+                panel_surf.blit(text, text.get_rect(bottomright=rect.bottomright))
+        return rect
+
+    def _update_middle_panel(self) -> pygame.Rect | None:
         inv = self.player.get_inv()
-        icons_in_line = inv.capacity // 2
-        panel_width = TILE_SIZE * icons_in_line
-        panel_height = TILE_SIZE * 2
-        panel_surf = pygame.Surface((panel_width, panel_height))
-        
-        for i in range(inv.capacity):
-            slot_index = i + 1
-            item = inv.slots.get(slot_index)
-            is_second_line = i >= icons_in_line
-            x = TILE_SIZE * (i % icons_in_line)
-            y = TILE_SIZE * int(is_second_line)
-            
-            slot_img = inv.SELECTED_SLOT_IMG if inv.selected == slot_index else inv.INV_SLOT_IMG
-            panel_surf.blit(slot_img, (x, y))
-            if item:
-                panel_surf.blit(item.icon, (x, y))
-        
-        self.statusbar.blit(panel_surf, (self.PANEL_SECTION_OFFSET, 0))
+        # Only the page holding the selection is shown
+        first = inv.page_start()
+        last = min(inv.capacity, first + INV_PAGE_SIZE - 1)
+        state = (inv, inv.capacity, first, inv.version, inv.selected)
+        shown = self._shown.get('middle')
+        if shown == state:
+            return None
 
-    def _update_right_panel(self) -> None:
-        panel_width = self.PANEL_SECTION_OFFSET * 3
-        panel_surf = pygame.Surface((panel_width, STATUSBAR_HEIGHT))
-        env_info = self.player.get_env_info(self.game_field, self.enemies)
+        pages = -(-inv.capacity // INV_PAGE_SIZE)
+        panel_size = (TILE_SIZE * ((min(inv.capacity, INV_PAGE_SIZE) + 1) // 2),
+                      TILE_SIZE * 2 + (LINE_OFFSET if pages > 1 else 0))
+        pos = (self.PANEL_SECTION_OFFSET, 0)
+        if shown is None or shown[:3] != state[:3] or self._middle_panel.get_size() != panel_size:
+            self._middle_panel = pygame.Surface(panel_size)
+            self._middle_panel.fill(BLACK)
+            for slot in range(first, last + 1):
+                self._draw_slot(inv, slot, first)
+            if pages > 1:
+                self._middle_panel.blit(self._render_text(f'{first // INV_PAGE_SIZE + 1}/{pages}', WHITE),
+                                        (0, TILE_SIZE * 2))
+            return self._show('middle', state, self._middle_panel, pos)
+
+        # Only the slots on the page that changed since the last draw, and the old and new selection
+        slots = set(inv.changed_since(shown[3]))
+        if shown[4] != inv.selected:
+            slots.update((shown[4], inv.selected))
+        slots = [slot for slot in slots if first <= slot <= last]
+        self._shown['middle'] = state
+        if not slots:
+            return None
+        rects = [self._draw_slot(inv, slot, first) for slot in slots]
+        area = rects[0].unionall(rects[1:])
+        panel_area = self._middle_panel.subsurface(area)
+        self.statusbar.blit(panel_area, area.move(pos))
+        self.screen.blit(panel_area, area.move(pos[0], pos[1] + self.rect.y))
+        return area.move(pos[0], pos[1] + self.rect.y)
+
+    def _update_right_panel(self) -> pygame.Rect | None:
+        env_info = self.player.get_env_info(self.game_field)
         weapon_value =  "Fists" if self.player.weapon is None else self.player.weapon.name
         weapon_info = {'Weapon': weapon_value}
         effects = self.player.list_effects()
         info = env_info | weapon_info | effects
         
-        for i, (key, value) in enumerate(info.items()):
+        lines = []
+        for key, value in info.items():
             if isinstance(value, list):
-                text = f'{key}: {", ".join(value)}'
+                lines.append(f'{key}: {", ".join(value)}')
             else:
-                text = f'{key}: {value}'
-                
-            text_surf = self.font.render(text, False, WHITE)
-            panel_surf.blit(text_surf, (0, i * LINE_OFFSET))
+                lines.append(f'{key}: {value}')
+        lines = tuple(lines)
+        if self._shown.get('right') == lines:
+            return None
 
-        self.statusbar.blit(panel_surf, (self.PANEL_SECTION_OFFSET * 2, 0))
+        self._right_panel.fill(BLACK)
+        for i, text in enumerate(lines):
+            self._right_panel.blit(self._render_text(text, WHITE), (0, i * LINE_OFFSET))
+        return self._show('right', lines, self._right_panel, (self.PANEL_SECTION_OFFSET * 2, 0))
 
-    def dead_message(self):
+    def dead_message(self) -> pygame.Rect:
         self.statusbar.fill(BLACK)
         panel_width = self.PANEL_SECTION_OFFSET * 3
         panel_surf = pygame.Surface((panel_width, STATUSBAR_HEIGHT))
         text = 'You died :'
-        text_surf = self.font.render(text, False, WHITE)
+        text_surf = self._render_text(text, WHITE)
         panel_surf.blit(text_surf, (0, 0))
         self.statusbar.blit(panel_surf, (self.PANEL_SECTION_OFFSET * 2, 0))
         self.screen.blit(self.statusbar, (0, HEIGHT - STATUSBAR_HEIGHT))
+        # Whatever was shown before is gone now
+        self._shown.clear()
+        self._stale.update(('left', 'middle', 'right'))
+        return self.rect
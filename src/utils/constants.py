@@ -7,4 +7,18 @@ BLACK = (0, 0, 0)
 GRAY = (100, 100, 100)
 BLEEDING_DAMAGE = 5
 BLEEDING_TIME = 4
-STUN_TIME = 3
\ No newline at end of file
+STUN_TIME = 3
+FLOW_DETOUR_MARGIN = 10  # steps the flow field reaches past a chaser's detection range, to walk around walls
+MAX_PATH_LENGTH = 64  # A* gives up on longer paths
+PATH_REPAIR_EXPANSIONS = 256  # A* budget for patching a cached path, past it the path is replanned
+CHUNK_SIZE = 32  # tiles per side of a map chunk
+CHUNK_LOAD_MARGIN = 2  # chunks around the view whose baked surfaces are kept
+FOV_RADIUS = 10  # field of view is computed at least this far out
+SPATIAL_CELL_SIZE = 16  # tiles per side of a spatial hash bucket
+AI_WAKE_RANGE = 32  # enemies further from the player are frozen
+TEXT_CACHE_SIZE = 256  # rendered text surfaces kept by the statusbar
+MAX_FPS = 60  # renders per second at most, input arriving in between is batched into one frame
+SHARD_SIZE = 64  # tiles per side of a shard, the unit of enemy AI handed to a worker process
+SHARD_MIN_ENEMIES = 256  # fewer awake enemies than this are decided in-process, IPC would cost more
+MAX_STACK = 20  # items of one type sharing an inventory slot
+INV_PAGE_SIZE = 10  # inventory slots shown at once, one per number key
@@ -1,9 +1,13 @@
 from math import sqrt
+from pathlib import Path
 from utils.constants import TILE_SIZE, HEIGHT, STATUSBAR_HEIGHT, WIDTH
 import pygame
 
+SPRITES_DIR = Path(__file__).resolve().parents[2] / 'sprites'
+
 def load_sprite(img_name: str):
-    return pygame.image.load(f'../sprites/{img_name}.png').convert_alpha()
+    '''Single sprite straight from its file, the game itself takes them from systems.assets.Atlas'''
+    return pygame.image.load(SPRITES_DIR / f'{img_name}.png').convert_alpha()
 
 def cartesian_distance(pos1, pos2) -> float:
     r1, c1 = pos1